@@ -0,0 +1,209 @@
+#!/usr/bin/python3
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from benchart import BenchArt
+from loader import Loader, normalize
+from renderer import render_multi
+from tree import render_print_tree
+import synth
+
+# Times each stage of the pipeline (loading, normalizing, grouping and
+# rendering) on synthetic results at several scales and records the best time
+# of a few repeats, throughput in Runs per second and the peak memory
+# allocated by Python during the stage. Results are written to a JSON file
+# named after the commit they were measured at so that they can be compared
+# over time:
+#
+#   python bench.py --scales small medium --output results/
+#   python bench.py --compare results/a.json results/b.json
+
+# Arguments to synth.generate()
+SCALES = {
+    'small': dict(runs=20, attrs=10, samples=300, sources=2),
+    'medium': dict(runs=200, attrs=20, samples=600, sources=3),
+    'large': dict(runs=1000, attrs=40, samples=1800, sources=3, gucs=300),
+}
+
+STAGES = ['load', 'normalize', 'benchart', 'render_print_tree', 'render_multi']
+
+
+class Case:
+    """
+    One scale of synthetic results and the state each stage needs, built by
+    the stages before it
+    """
+    def __init__(self, root, params):
+        self.root = root
+        self.params = params
+        self.data_exprs = synth.data_exprs(params.get('sources', 2))
+        self.runs = None
+        self.benchart = None
+
+    def loader(self):
+        return Loader(self.root)
+
+    def load(self):
+        self.runs = self.loader().run(self.data_exprs, synth.metadata,
+                                      synth.stats, synth.TIMELINE)
+
+    def setup_normalize(self):
+        loader = self.loader()
+        paths = [os.path.join(self.root, name) for name in sorted(os.listdir(self.root))]
+        self.unnormalized = loader.load_all(paths, 1, self.data_exprs,
+                                            synth.metadata, synth.stats,
+                                            synth.TIMELINE, 1, 1, None, False,
+                                            None, False)
+
+    def normalize(self):
+        normalize(self.unnormalized)
+
+    def benchart_run(self):
+        depth = self.params.get('depth', 2)
+        self.benchart = BenchArt(self.runs)
+        self.benchart.part(None, 'machine_instance_type', 'machine_disk_limits_size')
+        self.benchart.part(None, synth.attr_name(0, depth))
+        self.benchart.ignore(*(synth.attr_name(i, depth)
+                               for i in range(1, self.params.get('attrs', 10))))
+        self.root_group = self.benchart.run()
+
+    def print_tree(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            render_print_tree(self.root_group)
+
+    def render(self):
+        prefixes = synth.source_names(self.params.get('sources', 2))
+        render_multi(self.benchart, 15, prefixes, (0, None), {},
+                     lambda runs: '', lambda axes: None)
+        plt.close('all')
+
+
+# The setup (untimed) and timed function of each stage
+def stage(case, name):
+    return {
+        'load': (None, case.load),
+        'normalize': (case.setup_normalize, case.normalize),
+        'benchart': (None, case.benchart_run),
+        'render_print_tree': (None, case.print_tree),
+        'render_multi': (None, case.render),
+    }[name]
+
+
+# Time fn repeat times after a first call under tracemalloc for the peak
+# memory. Returns the best seconds and the peak bytes.
+def measure(setup, fn, repeat):
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    best = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, peak
+
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run(scales, stages, repeat, datadir):
+    results = []
+    for scale in scales:
+        params = SCALES[scale]
+        root = os.path.join(datadir, scale)
+        if not os.path.isdir(root):
+            synth.generate(root, **params)
+        case = Case(root, params)
+        # Later stages need the results of earlier ones
+        for name in STAGES:
+            setup, fn = stage(case, name)
+            if name not in stages:
+                if setup is not None:
+                    setup()
+                fn()
+                continue
+            seconds, peak = measure(setup, fn, repeat)
+            results.append({
+                'scale': scale,
+                'stage': name,
+                'runs': params['runs'],
+                'seconds': seconds,
+                'runs_per_second': params['runs'] / seconds if seconds else None,
+                'peak_bytes': peak,
+            })
+            print(f'{scale:8} {name:20} {seconds * 1000:10.1f} ms '
+                  f'{results[-1]["runs_per_second"]:10.1f} runs/s '
+                  f'{peak / 2**20:8.1f} MiB', flush=True)
+    return results
+
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = {(r['scale'], r['stage']): r for r in json.load(f)['results']}
+    with open(new_path) as f:
+        new = json.load(f)['results']
+    for result in new:
+        before = old.get((result['scale'], result['stage']))
+        if before is None:
+            continue
+        ratio = result['seconds'] / before['seconds']
+        memory = result['peak_bytes'] / max(before['peak_bytes'], 1)
+        print(f'{result["scale"]:8} {result["stage"]:20} '
+              f'time x{ratio:5.2f} memory x{memory:5.2f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline')
+    parser.add_argument('--scales', nargs='+', default=['small', 'medium'],
+                        choices=list(SCALES))
+    parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--data', default=os.path.join(tempfile.gettempdir(),
+                                                       'bencharts-bench'),
+                        help='where synthetic results are generated and kept')
+    parser.add_argument('--output', default='.',
+                        help='directory to write the results JSON to')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='compare two results files instead')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    else:
+        results = run(args.scales, args.stages, args.repeat, args.data)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        sha = commit()
+        os.makedirs(args.output, exist_ok=True)
+        path = os.path.join(args.output,
+                            f'bench-{now:%Y%m%dT%H%M%S}-{sha}.json')
+        with open(path, 'w') as f:
+            json.dump({'commit': sha, 'time': now.isoformat(),
+                       'scales': {scale: SCALES[scale] for scale in args.scales},
+                       'results': results}, f, indent=2)
+        print(path)
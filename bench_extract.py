@@ -0,0 +1,63 @@
+#!/usr/bin/python3
+
+import argparse
+import functools as ft
+import random
+import timeit
+import pandas as pd
+from loader import informed_extract_to_df
+import synth
+
+# Compares loader.informed_extract_to_df(), which aligns every data source on
+# the union of their timestamps in one pass, to the implementation it
+# replaced, which outer merged the sources one at a time, on synthetic result
+# files (see synth.py) with more and more sources and samples. Both must give
+# the same DataFrame, which is checked before timing them.
+
+
+def extract_merged(exprs, text, timeline, interval=None):
+    df_final = pd.DataFrame()
+    for name, data_expr in exprs.items():
+        data = data_expr(text)
+        if not data:
+            continue
+        df = pd.DataFrame(data)
+        df[timeline] = pd.to_datetime(df[timeline], utc=True)
+        df = df.set_index(timeline).add_prefix(name + '_')
+        df_final = df if df_final.empty else \
+            pd.merge(df_final, df, how='outer', left_index=True, right_index=True)
+
+    if interval is not None and len(df_final):
+        df_final = df_final.resample(interval, origin='start').mean()
+
+    zero = df_final.index.min()
+    df_final['relative_time'] = df_final.index - zero
+    return df_final.set_index('relative_time')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmark loader.informed_extract_to_df()')
+    parser.add_argument('--sources', type=int, nargs='+', default=[2, 4, 8, 16])
+    parser.add_argument('--samples', type=int, nargs='+',
+                        default=[600, 3600, 14400])
+    parser.add_argument('--interval', help="also resample, e.g. '1s'")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    for sources in args.sources:
+        exprs = synth.data_exprs(sources)
+        for samples in args.samples:
+            text = {'data': synth.make_data(random.Random(0), samples, sources)}
+            extract = ft.partial(informed_extract_to_df, exprs, text,
+                                 synth.TIMELINE, args.interval)
+            merged = ft.partial(extract_merged, exprs, text, synth.TIMELINE,
+                                args.interval)
+            pd.testing.assert_frame_equal(extract(), merged())
+
+            times = {name: min(timeit.repeat(case, number=1, repeat=args.repeat))
+                     for name, case in [('merge', merged), ('align', extract)]}
+            print(f'{sources:3} sources {samples:6} samples  '
+                  f"merge {times['merge'] * 1000:8.1f} ms  "
+                  f"align {times['align'] * 1000:8.1f} ms  "
+                  f"{times['merge'] / times['align']:5.1f}x")
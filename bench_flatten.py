@@ -0,0 +1,99 @@
+#!/usr/bin/python3
+
+import argparse
+import random
+import sys
+import timeit
+from collections.abc import MutableMapping
+from loader import flatten
+
+# Compares loader.flatten() to the recursive implementation it replaced on
+# metadata shaped like ours: machine and disk settings, the benchmark config
+# and a dump of every GUC under postgres_gucs.
+
+
+def flatten_recursive(dictionary, parent_key=''):
+    result = {}
+    for k, v in dictionary.items():
+        new_key = parent_key + '_' + k if parent_key else k
+        if isinstance(v, MutableMapping):
+            result.update(flatten_recursive(v, parent_key=new_key))
+        else:
+            result[new_key] = v
+    return result
+
+
+def metadata(rng, gucs):
+    return {
+        'benchmark': {
+            'large_read': rng.choice(['', 'none', 'seq']),
+            'config': {'scale': rng.choice([10, 100, 1000]), 'time': 600},
+        },
+        'machine': {
+            'instance': {
+                'type': rng.choice(['Standard_D2ds_v4', 'Standard_D16ds_v4']),
+                'hostinfo': {'Hostname': f'vm-{rng.randrange(8)}',
+                             'KernelRelease': rng.choice(['5.18.5', '5.18.5+'])},
+                'limits': {'uncached_iops': 25600, 'uncached_bw_mbps': 384},
+                'mem_total_bytes': 67430400000,
+            },
+            'disk': {
+                'caching': rng.choice(['None', 'ReadOnly']),
+                'size_gb': 2048,
+                'limits': {'size': rng.choice(['p30', 'p40', 'ultra1024']),
+                           'iops': 7500, 'bw_mbps': 250},
+                'block_device_settings': {
+                    'queue_depth': rng.choice([128, 316]),
+                    'nr_hw_queues': rng.choice([1, 2]),
+                    'nr_requests': rng.choice([256, 316]),
+                    'scheduler': rng.choice(['none', 'mq-deadline']),
+                },
+            },
+        },
+        'postgres': {
+            'version': '16devel',
+            'gucs': {
+                'set_gucs': {'huge_pages': 'on', 'shared_buffers': '16GB'},
+                'all_gucs': {
+                    f'guc_{i}': {'setting': str(rng.randrange(4)),
+                                 'unit': rng.choice(['', 'kB', 'ms']),
+                                 'source': 'default'}
+                    for i in range(gucs)
+                },
+            },
+        },
+        'disks': [{'name': 'sdc', 'size_gb': 2048}, {'name': 'sdd', 'size_gb': 512}],
+    }
+
+
+# Bytes taken by the key strings of flattened, counting each string object
+# once
+def key_bytes(flattened):
+    seen = {}
+    for metadata in flattened:
+        for key in metadata:
+            seen[id(key)] = sys.getsizeof(key)
+    return sum(seen.values())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark loader.flatten()')
+    parser.add_argument('--runs', type=int, default=500)
+    parser.add_argument('--gucs', type=int, default=350)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    metadatas = [metadata(rng, args.gucs) for _ in range(args.runs)]
+    cases = {
+        'recursive': lambda: [flatten_recursive(m) for m in metadatas],
+        'flatten': lambda: [flatten(m) for m in metadatas],
+        "flatten arrays='index'": lambda: [flatten(m, arrays='index') for m in metadatas],
+        "flatten arrays='tuple'": lambda: [flatten(m, arrays='tuple') for m in metadatas],
+    }
+
+    for name, case in cases.items():
+        seconds = min(timeit.repeat(case, number=1, repeat=args.repeat))
+        keys = key_bytes(case())
+        print(f'{name:24} {seconds * 1000:9.1f} ms '
+              f'{args.runs / seconds:9.0f} runs/s {keys / 1024:9.0f} KiB of keys')
@@ -0,0 +1,91 @@
+#!/usr/bin/python3
+
+import argparse
+import random
+import timeit
+from benchart import BenchArt, Run
+from loader import normalize
+from metadata import RunMetadata
+
+# Compares hashing and equality of Runs and RunMetadata to the
+# implementations they replaced, which hashed the str() of all of a Run's
+# metadata (Run) or every item of it (RunMetadata) on every call, on many
+# normalized Runs with sparse metadata: sets and dicts of Runs, the grouping
+# done by Step.use() and BenchArt.run().
+
+
+class OldRunMetadata(RunMetadata):
+    __slots__ = ()
+
+    def __eq__(self, other):
+        return self.metadata == other.metadata
+
+    def __hash__(self):
+        return hash(frozenset(self.metadata.items()))
+
+    def subset(self, chosen_keys):
+        return OldRunMetadata({k: v for k, v in self.metadata.items()
+                               if k in chosen_keys})
+
+
+class OldRun(Run):
+    def __eq__(self, other):
+        if not isinstance(other, Run):
+            return NotImplemented
+        return self.metadata == other.metadata
+
+    def __hash__(self):
+        return hash(str(self.metadata))
+
+
+def runs(n, attrs, sparse, cls, metadata_cls):
+    rng = random.Random(0)
+    result = []
+    for i in range(n):
+        metadata = {f'attr{j}': rng.randrange(4) for j in range(attrs)}
+        metadata.update((f'extra{rng.randrange(sparse)}', rng.randrange(100))
+                        for _ in range(8))
+        result.append(cls(i, None, metadata, None, f'{i}.json'))
+    normalize(result)
+    for run in result:
+        run.metadata = metadata_cls(run.metadata.metadata)
+    return result
+
+
+# What Step.use() does for each of its parents
+def group(runs, attrs):
+    groups = {}
+    for run in runs:
+        groups.setdefault(run.metadata.subset(attrs), []).append(run)
+    return groups
+
+
+def benchart(runs, attrs):
+    benchart = BenchArt(runs)
+    for attr in attrs:
+        benchart.part(None, attr)
+    return benchart.run()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark Run hashing')
+    parser.add_argument('--runs', type=int, default=10000)
+    parser.add_argument('--attrs', type=int, default=10)
+    parser.add_argument('--sparse', type=int, default=200,
+                        help='number of keys only some Runs have')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    parts = [f'attr{j}' for j in range(3)]
+    for name, cls, metadata_cls in [('old', OldRun, OldRunMetadata),
+                                    ('new', Run, RunMetadata)]:
+        rs = runs(args.runs, args.attrs, args.sparse, cls, metadata_cls)
+        cases = {
+            'set of runs x3': lambda: [set(rs) for _ in range(3)],
+            'dict lookups': lambda: [d[run] for d in [dict.fromkeys(rs)] for run in rs],
+            'Step.use grouping': lambda: group(rs, set(parts)),
+            'BenchArt.run': lambda: benchart(rs, parts),
+        }
+        for case_name, case in cases.items():
+            seconds = min(timeit.repeat(case, number=1, repeat=args.repeat))
+            print(f'{name:4} {case_name:20} {seconds * 1000:9.1f} ms')
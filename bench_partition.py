@@ -0,0 +1,118 @@
+#!/usr/bin/python3
+
+import argparse
+import random
+import timeit
+from bench_hash import OldRun, OldRunMetadata
+from benchart import BenchArt, Run, RunGroup, Step
+from loader import normalize
+
+# Compares BenchArt.run(), which partitions every RunGroup of a level of the
+# tree at once with Step.partition(), to the implementation it replaced: a
+# scan of every Run per attribute to find the shared ones, then Step.use() on
+# each RunGroup in turn over dense metadata dicts hashed as a frozenset of
+# their items on every lookup (see bench_hash.py). Both must build the same
+# tree, including when a partitioning attribute is absent from every Run,
+# which is checked before timing them on Runs with sparse metadata for
+# several numbers of Runs and attributes.
+
+
+# BenchArt before MetadataTable codes and Step.partition()
+class OldBenchArt(BenchArt):
+    def get_all_shared_attrs(self):
+        all_shared_attrs = set()
+        for attr in self.all_attrs:
+            value = self.runs[0].metadata[attr]
+            if all(run.metadata[attr] == value for run in self.runs):
+                all_shared_attrs.add(attr)
+        return all_shared_attrs
+
+    def run(self):
+        shared = self.get_all_shared_attrs()
+        user = set()
+        for user_step in self.user_steps:
+            user.update(user_step.attrs)
+        steps = [Step(shared), Step(self.all_attrs - shared - user)]
+        steps += self.user_steps
+
+        og = RunGroup(None, None, self.runs)
+        groups = [og]
+        for step in steps:
+            current_level = []
+            for group in groups:
+                current_level.extend(step.use(group))
+            groups = current_level
+        self.steps = steps
+        self.tree = og
+        return og.children[0]
+
+
+def runs(n, attrs, sparse):
+    rng = random.Random(0)
+    result = []
+    for i in range(n):
+        metadata = {'version': '16devel'}
+        metadata.update((f'attr{j}', rng.randrange(4)) for j in range(attrs))
+        metadata.update((f'extra{rng.randrange(sparse)}', rng.randrange(100))
+                        for _ in range(4))
+        result.append(Run(i, None, metadata, None, f'{i}.json'))
+    normalize(result)
+    return result
+
+
+# Copies of rs as they were before: every key in a plain dict
+def old_runs(rs):
+    return [OldRun(run.id, None, OldRunMetadata(dict(run.metadata)), None,
+                   run.filename) for run in rs]
+
+
+# The tree under group as nested tuples of RunGroup metadata and Run ids
+def shape(group):
+    if isinstance(group, Run):
+        return group.id
+    return (dict(group.metadata) if group.metadata is not None else None,
+            [shape(child) for child in group.children])
+
+
+def build(cls, rs, parts):
+    benchart = cls(rs)
+    for attrs in parts:
+        benchart.part(None, *attrs)
+    benchart.ignore('extra0')
+    return benchart.run()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmark and check Step.partition() against Step.use()')
+    parser.add_argument('--runs', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--attrs', type=int, nargs='+', default=[4, 16, 64])
+    parser.add_argument('--sparse', type=int, default=50,
+                        help='number of keys only some Runs have')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    for n in args.runs:
+        for attrs in args.attrs:
+            rs = runs(n, attrs, args.sparse)
+            old_rs = old_runs(rs)
+            cases = {
+                'parts': [['attr0'], ['attr1', 'attr2']],
+                'absent part': [['attr0'], ['absent'], ['attr1', 'absent']],
+            }
+            for case_name, parts in cases.items():
+                old = shape(build(OldBenchArt, old_rs, parts))
+                new = shape(build(BenchArt, rs, parts))
+                assert old == new, f'{case_name}: trees differ for {n} runs'
+
+            parts = cases['parts']
+            times = {}
+            for name, cls, case_runs in [('use', OldBenchArt, old_rs),
+                                         ('partition', BenchArt, rs)]:
+                times[name] = min(timeit.repeat(
+                    lambda: build(cls, case_runs, parts), number=1,
+                    repeat=args.repeat))
+            print(f'{n:6} runs {attrs:3} attrs  '
+                  f"use {times['use'] * 1000:9.1f} ms  "
+                  f"partition {times['partition'] * 1000:9.1f} ms  "
+                  f"{times['use'] / times['partition']:5.1f}x")
@@ -1,7 +1,10 @@
 #!/usr/local/bin/python3
 
-from metadata import RunMetadata
+from metadata import MetadataRow, MetadataTable, RunMetadata
+import numpy as np
+import pandas as pd
 import pprint
+from timing import as_report
 
 class Run:
     """
@@ -10,22 +13,57 @@ class Run:
     def __init__(self, id, all_data, metadata, stats, filename):
         self.id = id
         self.all_data = all_data
-        self.metadata = RunMetadata(metadata)
+        if not isinstance(metadata, RunMetadata):
+            metadata = RunMetadata(metadata)
+        self.metadata = metadata
         self.stats = stats
         self.rungroup = None
         self.filename = filename
+        # Summaries of the data at several resolutions, see pyramid.py
+        self.pyramid = None
+
+    # The data of a Run may be kept elsewhere, such as in a RunStore, in which
+    # case it is fetched from there on access
+    @property
+    def all_data(self):
+        if self.data_source is not None:
+            return self.data_source.get(self)
+        return self._all_data
+
+    @all_data.setter
+    def all_data(self, all_data):
+        self._all_data = all_data
+        self.data_source = None
+        # Lines of the data decimated by PlotRenderer.line(), which are stale
+        # once the data is replaced
+        self.lines = {}
+
+    # Let a data source which builds the data on demand free it
+    def release(self):
+        release = getattr(self.data_source, 'release', None)
+        if release is not None:
+            release(self)
 
     def __eq__(self, other):
+        if self is other:
+            return True
         if not isinstance(other, Run):
             return NotImplemented
         return self.metadata == other.metadata
 
+    # RunMetadata caches its hash
     def __hash__(self):
-        return hash(str(self.metadata))
+        return hash(self.metadata)
 
     def __repr__(self):
         return "Run %s" % (str(self.id))
 
+    # The metadata which distinguishes this Run from the other Runs in its
+    # RunGroup: everything not already in the RunGroup or its ancestors
+    def label_metadata(self, occludes=frozenset()):
+        show_attrs = self.metadata.keys() - self.rungroup.accumulated_attrs - occludes
+        return self.metadata.subset(show_attrs)
+
 
 class Step:
     """
@@ -45,6 +83,67 @@ class Step:
         parent.children = result_rgs
         return result_rgs
 
+    # The same as use() but for every RunGroup of a level of the tree at once,
+    # comparing Runs by the codes of their attributes in table, a
+    # MetadataTable with a row of codes per Run. labels gives, for each row of
+    # codes (and position in runs), the index in parents of the RunGroup
+    # containing that Run. Returns the new RunGroups and labels indexing them.
+    # Groups are ordered by parent and then by the first Run they contain, as
+    # with use().
+    def partition(self, parents, labels, runs, table, codes):
+        if not parents:
+            return [], labels
+        columns = table.columns
+        # Combine the parent label and the codes of each attribute into a
+        # single key per Run. factorize() numbers keys by first appearance.
+        # An attribute no Run has is the same (absent) for every Run, so it
+        # doesn't split any group, as with subset() in use().
+        key = labels
+        for attr in self.attrs:
+            if attr not in columns:
+                continue
+            column = codes[:, columns[attr]].astype(np.int64)
+            key, _ = pd.factorize(key * (int(column.max()) + 1) + column)
+
+        _, first = np.unique(key, return_index=True)
+        group_parents = labels[first]
+        order = np.argsort(group_parents, kind='stable')
+        rank = np.empty(len(order), dtype=np.intp)
+        rank[order] = np.arange(len(order))
+        labels = rank[key]
+
+        by_group = np.argsort(labels, kind='stable')
+        bounds = np.cumsum(np.bincount(labels))[:-1]
+
+        # Every group's metadata has its keys in the same order as subset().
+        # The values of the first Run of every group are looked up in the
+        # categories of the table a column at a time.
+        attrs = [attr for attr in table.keys if attr in self.attrs]
+        firsts = by_group[np.concatenate(([0], bounds))]
+        values = []
+        for attr in attrs:
+            j = columns[attr]
+            categories = np.fromiter(table.categories[j], dtype=object,
+                                     count=len(table.categories[j]))
+            values.append(categories[codes[firsts, j]])
+        group_values = zip(*values) if attrs else [()] * len(firsts)
+
+        # The Runs in group order, sliced into each group as plain lists
+        ordered = [runs[row] for row in by_group.tolist()]
+        starts = [0] + bounds.tolist()
+        ends = bounds.tolist() + [len(ordered)]
+        children = [[] for _ in parents]
+        groups = []
+        for parent, start, end, row_values in zip(
+                group_parents[order].tolist(), starts, ends, group_values):
+            sm = RunMetadata(dict(zip(attrs, row_values)))
+            groups.append(RunGroup(parents[parent], sm, ordered[start:end]))
+            children[parent].append(groups[-1])
+
+        for parent, parent_children in zip(parents, children):
+            parent.children = parent_children
+        return groups, labels
+
     def __repr__(self):
         return f'Step attributes: {self.attrs}'
 
@@ -57,15 +156,18 @@ class IgnoreStep(Step):
     def use(self, parent):
         return []
 
+    def partition(self, parents, labels, runs, table, codes):
+        return [], labels
+
 
 class RunGroup:
     """
     A grouping of Runs which share certain metadata attributes
     """
     def __init__(self, parent, shared_metadata, children=None):
-        self.metadata = shared_metadata
         self.parent = parent
         self.children = children or []
+        self.metadata = shared_metadata
 
         # Hack so that the accumulated_attrs property works to make a label for
         # Runs. A Run sets itself as its RunGroup. Then when making its label,
@@ -84,21 +186,58 @@ class RunGroup:
     def __repr__(self):
         return f'Metadata: {self.metadata}'
 
+    # Setting the metadata of a RunGroup invalidates the accumulated metadata
+    # cached by it and its descendants
+    @property
+    def metadata(self):
+        return self._metadata
+
+    @metadata.setter
+    def metadata(self, metadata):
+        self._metadata = metadata
+        self.invalidate()
+
+    def invalidate(self):
+        self._accumulated_attrs = None
+        self._accumulated_metadata = None
+        # Data aligned on a common grid by grid.align_group() and replicates
+        # aggregated by replicates.aggregate_group()
+        self.aligned = {}
+        for child in self.children:
+            if isinstance(child, RunGroup):
+                child.invalidate()
+
     @property
     def accumulated_attrs(self):
-        result = set(self.metadata.keys())
-        if self.parent is not None and self.parent.metadata is not None:
-            result |= self.parent.accumulated_attrs
-        return result
+        if self._accumulated_attrs is None:
+            result = frozenset(self.metadata.keys())
+            if self.parent is not None and self.parent.metadata is not None:
+                result |= self.parent.accumulated_attrs
+            self._accumulated_attrs = result
+        return self._accumulated_attrs
 
     # A RunMetadata containing all of the metadata of a RunGroup and all its
     # ancestors
     @property
     def accumulated_metadata(self):
-        if self.parent is not None and self.parent.metadata is not None:
-            return self.metadata.union(self.parent.accumulated_metadata)
-        else:
-            return self.metadata
+        if self._accumulated_metadata is None:
+            if self.parent is not None and self.parent.metadata is not None:
+                result = self.metadata.union(self.parent.accumulated_metadata)
+            else:
+                result = self.metadata
+            self._accumulated_metadata = result
+        return self._accumulated_metadata
+
+    # The label_metadata() of every Run in this tree, as (Run, RunMetadata)
+    # pairs in the order of iterruns()
+    def label_metadata(self, occludes=frozenset()):
+        result = []
+        for group in self.iterleafparents():
+            hidden = group.accumulated_attrs | occludes
+            for run in group.children:
+                if isinstance(run, Run):
+                    result.append((run, run.metadata.subset(run.metadata.keys() - hidden)))
+        return result
 
     def iterruns(self):
         for child in self.children:
@@ -107,6 +246,14 @@ class RunGroup:
             else:
                 yield from child.iterruns()
 
+    # Yield every RunGroup in this tree whose children are Runs
+    def iterleafparents(self):
+        if any(isinstance(child, Run) for child in self.children):
+            yield self
+            return
+        for child in self.children:
+            yield from child.iterleafparents()
+
 
 class BenchArt:
     """
@@ -125,15 +272,26 @@ class BenchArt:
     RunGroups is all the user-specified attributes. This layer may be composed
     of many levels of sibling RunGroups.
     After running the BenchArt, the tree of RunGroups can be rendered.
+    Runs loaded later can be added to a BenchArt which has already been run
+    without rebuilding the tree as long as they don't change which attributes
+    are shared by all Runs.
+    With profile (True or a timing.Report), the time taken by each step of
+    run() is recorded in report.
     """
-    def __init__(self, runs):
+    def __init__(self, runs, profile=False):
         # A list of Runs
         self.runs = runs
-        # We assume loader has standardized all runs to have the same keys
-        self.all_attrs = runs[0].metadata.keys()
+        # We assume loader has standardized all runs to have the same keys.
+        # They are copied since normalized keys can grow (see loader.widen()).
+        self.all_attrs = set(runs[0].metadata.keys())
         self.user_steps = []
         self.renderers = []
         self.ignores = set()
+        # The Steps and tree of the last run()
+        self.steps = None
+        self.tree = None
+        self.metadata_codes = None
+        self.report = as_report(profile)
 
     # these must be appended in order
     def part(self, renderer, *attrs):
@@ -149,22 +307,36 @@ class BenchArt:
         self.ignores.update(attrs)
         return self.user_steps.append(IgnoreStep(set(attrs)))
 
+    # Return a MetadataTable of the metadata of all Runs and its codes, with
+    # one row per Run in the order of self.runs. Runs loaded with compact
+    # metadata already share a table.
+    def get_metadata_codes(self):
+        if self.metadata_codes is not None:
+            return self.metadata_codes
+
+        mappings = [run.metadata.metadata for run in self.runs]
+        table = getattr(mappings[0], 'table', None)
+        if all(isinstance(m, MetadataRow) and m.table is table for m in mappings):
+            codes = table.codes[[m.row for m in mappings]]
+        else:
+            table = MetadataTable([run.metadata for run in self.runs])
+            codes = table.codes
+        self.metadata_codes = table, codes
+        return self.metadata_codes
+
     # returns a set of string, which are the attributes on which all runs agree
     # e.g. {"ver", "hp"}
     def get_all_shared_attrs(self):
-        all_shared_attrs = set()
-        for attr in self.all_attrs:
-            value = self.runs[0].metadata[attr]
-            if all(run.metadata[attr] == value for run in self.runs):
-                all_shared_attrs.add(attr)
-
-        return all_shared_attrs
+        table, codes = self.get_metadata_codes()
+        shared = (codes == codes[0]).all(axis=0)
+        return {attr for attr in self.all_attrs if shared[table.columns[attr]]}
 
     def run(self):
         # a list of set(str), for example [{"ver", "hp"}, {"bfa"}]
         steps = []
         # Find all the attributes on which all runs agree
-        all_shared_attrs = self.get_all_shared_attrs()
+        with self.report.phase('shared_attrs'):
+            all_shared_attrs = self.get_all_shared_attrs()
         steps.append(Step(all_shared_attrs))
 
         # Find all the attributes which are neither agreed upon by all nor in
@@ -178,12 +350,61 @@ class BenchArt:
         steps += self.user_steps
 
         og = RunGroup(None, None, self.runs)
+        table, codes = self.get_metadata_codes()
         groups = [og]
+        labels = np.zeros(len(self.runs), dtype=np.intp)
 
-        for step in steps:
-            current_level = []
-            for group in groups:
-                current_level.extend(step.use(group))
-            groups = current_level
+        for i, step in enumerate(steps):
+            with self.report.phase(f'step {i}'):
+                groups, labels = step.partition(groups, labels, self.runs,
+                                                table, codes)
+            self.report.count('groups', len(groups))
 
+        self.steps = steps
+        self.tree = og
         return og.children[0]
+
+    # Add Runs to the tree built by the last run(). The runs must have been
+    # normalized against the existing ones (see loader.widen()). Returns the
+    # root and a list of the RunGroups whose child Runs changed, which are the
+    # only ones that need to be rendered again. If the new Runs change which
+    # attributes are shared or add attributes, the tree is rebuilt and every
+    # leaf parent RunGroup is returned.
+    def add(self, runs):
+        with self.report.phase('add'):
+            self.runs = self.runs + runs
+            self.metadata_codes = None
+            all_attrs = set(self.runs[0].metadata.keys())
+            if self.tree is None or all_attrs != self.all_attrs or \
+                    self.get_all_shared_attrs() != self.steps[0].attrs:
+                self.all_attrs = all_attrs
+                root = self.run()
+                return root, list(root.iterleafparents())
+
+            affected = []
+            for run in runs:
+                group = self.insert(run)
+                if not any(group is seen for seen in affected):
+                    affected.append(group)
+            return self.tree.children[0], affected
+
+    # Walk run down the tree built by the last run(), creating any RunGroups
+    # it doesn't match, and return the RunGroup it was added to
+    def insert(self, run):
+        group = self.tree
+        for step in self.steps:
+            if isinstance(step, IgnoreStep):
+                break
+            shared_metadata = run.metadata.subset(step.attrs)
+            for child in group.children:
+                if child.metadata == shared_metadata:
+                    group = child
+                    break
+            else:
+                child = RunGroup(group, shared_metadata)
+                group.children.append(child)
+                group = child
+
+        group.children.append(run)
+        run.rungroup = group
+        return group
@@ -0,0 +1,166 @@
+#!/usr/bin/python3
+
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+from benchart import Run
+from loader import Loader, normalize
+from metadata import MISSING
+
+# A compact on-disk layout for loaded Runs: one directory per Run holding a
+# NumPy .npy file per column plus one for relative_time, and a manifest.json
+# with the metadata, stats and column names of every Run. Opening it with
+# load() memory maps the columns, so a Run's data is only read from disk for
+# the columns and rows that are actually used.
+
+
+def convert(runs, outdir):
+    """
+    Write runs, as returned by Loader.run(), to outdir. Numeric, boolean and
+    datetime columns are stored as they are. Other columns are stored as
+    fixed-width strings. Each Run's data is released once it is written, so
+    Runs loaded with lazy=True are converted one at a time. The metadata and
+    stats of every Run are checked to be valid JSON before any data is
+    written.
+    """
+    manifest = []
+    for run in runs:
+        entry = {
+            'id': run.id,
+            'filename': run.filename,
+            'dir': f'run-{run.id:06d}',
+            'metadata': {k: v for k, v in run.metadata.items()
+                         if v is not MISSING},
+            'stats': run.stats,
+        }
+        try:
+            json.dumps(entry)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f'The metadata or stats of Run {run.id} can\'t '
+                             f'be written as JSON: {e}') from e
+        manifest.append(entry)
+
+    os.makedirs(outdir, exist_ok=True)
+    for run, entry in zip(runs, manifest):
+        rundir = entry['dir']
+        os.makedirs(os.path.join(outdir, rundir), exist_ok=True)
+        df = run.all_data
+
+        index = np.asarray(pd.TimedeltaIndex(df.index).as_unit('ns').asi8)
+        np.save(os.path.join(outdir, rundir, 'relative_time.npy'), index)
+
+        columns = []
+        for i, column in enumerate(df.columns):
+            values = df[column].to_numpy()
+            if values.dtype.kind not in 'biufcmM':
+                values = values.astype(str)
+            np.save(os.path.join(outdir, rundir, f'{i}.npy'), values)
+            columns.append(column)
+        entry['columns'] = columns
+        run.release()
+
+    with open(os.path.join(outdir, 'manifest.json'), 'w') as f:
+        json.dump({'runs': manifest}, f)
+
+
+class BinaryRuns:
+    """
+    The data source of Runs opened by load(). Each time a Run's all_data is
+    accessed, a DataFrame is built on memory mapped columns without reading
+    them.
+    """
+    def __init__(self, root, entries):
+        self.root = root
+        self.entries = entries
+
+    def column(self, run, i):
+        entry = self.entries[run.id]
+        return np.load(os.path.join(self.root, entry['dir'], f'{i}.npy'),
+                       mmap_mode='r')
+
+    def index(self, run):
+        entry = self.entries[run.id]
+        stamps = np.load(os.path.join(self.root, entry['dir'], 'relative_time.npy'),
+                         mmap_mode='r')
+        return pd.TimedeltaIndex(stamps.view('m8[ns]'), name='relative_time')
+
+    # Build the DataFrame of run, optionally with only some columns and only
+    # the rows between start and end (Timedeltas), which are found by binary
+    # search on the mapped relative_time column.
+    def get(self, run, columns=None, start=None, end=None):
+        entry = self.entries[run.id]
+        index = self.index(run)
+        lo = 0 if start is None else index.searchsorted(start, side='left')
+        hi = len(index) if end is None else index.searchsorted(end, side='right')
+
+        data = {}
+        for i, column in enumerate(entry['columns']):
+            if columns is not None and column not in columns:
+                continue
+            data[column] = self.column(run, i)[lo:hi]
+        return pd.DataFrame(data, index=index[lo:hi], copy=False)
+
+
+def load(root):
+    """
+    Open Runs written by convert(). Metadata and stats are read from the
+    manifest while data is memory mapped on access.
+    """
+    with open(os.path.join(root, 'manifest.json')) as f:
+        entries = json.load(f)['runs']
+
+    source = BinaryRuns(root, {entry['id']: entry for entry in entries})
+    runs = []
+    for entry in entries:
+        run = Run(entry['id'], None, entry['metadata'], entry['stats'],
+                  entry['filename'])
+        run.data_source = source
+        runs.append(run)
+    normalize(runs)
+    return runs
+
+
+class PathExpr:
+    """
+    A data or metadata expression given as a dotted path of keys, e.g.
+    "data.pgbench.progress"
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, all_info):
+        for key in self.path.split('.'):
+            all_info = all_info[key]
+        return all_info
+
+    def __repr__(self):
+        return f'PathExpr({self.path!r})'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Convert a results directory to memory mappable files')
+    parser.add_argument('results')
+    parser.add_argument('outdir')
+    parser.add_argument('--data', action='append', required=True,
+                        metavar='NAME=PATH',
+                        help='a data source and the dotted path to it, '
+                             'e.g. pgbench=data.pgbench.progress')
+    parser.add_argument('--metadata', default='metadata')
+    parser.add_argument('--timeline', required=True)
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+
+    data_exprs = {}
+    for spec in args.data:
+        name, path = spec.split('=', 1)
+        data_exprs[name] = PathExpr(path)
+
+    # Only the metadata is loaded up front and each Run's data is built as
+    # it is converted
+    runs = Loader(args.results).run(data_exprs, PathExpr(args.metadata),
+                                    None, args.timeline,
+                                    workers=args.workers, lazy=True)
+    convert(runs, args.outdir)
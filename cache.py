@@ -0,0 +1,194 @@
+import hashlib
+import json
+import os
+import shutil
+import types
+import pandas as pd
+
+# Returned by RunCache.get() when there is no usable entry. A cached None
+# means the file was discarded.
+MISS = object()
+
+
+class RunCache:
+    """
+    An on-disk cache of what a Loader extracts from each result file: the
+    DataFrame made by informed_extract_to_df() (stored as Parquet) and the
+    flattened metadata and stats (stored as JSON). Files which were discarded
+    are cached too so they need not be parsed again, and lazily loaded files
+    are cached without their data until it is first used.
+    Entries are keyed by the path, mtime and size of the result file and a
+    fingerprint of the expressions used to load it, so modifying a file or
+    changing an expression makes its old entry unreachable.
+    When max_bytes is set, the least recently used entries are evicted until
+    the cache fits.
+    """
+    def __init__(self, root, max_bytes=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok=True)
+
+    def key(self, path, fingerprint):
+        st = os.stat(path)
+        raw = f'{os.path.abspath(path)}\0{st.st_mtime_ns}\0{st.st_size}\0{fingerprint}'
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    # The result cached under key: the data, metadata and stats of the file,
+    # None if it was discarded or MISS. Without data, only the metadata and
+    # stats are read and the data returned is None, so entries stored without
+    # data (see put()) are hits too.
+    def get(self, key, data=True):
+        entry = os.path.join(self.root, key)
+        try:
+            with open(os.path.join(entry, 'info.json')) as f:
+                info = json.load(f)
+            if info['discarded']:
+                result = None
+            else:
+                frame = self.data(key) if data else None
+                if frame is MISS:
+                    return MISS
+                result = frame, info['metadata'], info['stats']
+        except (OSError, ValueError, KeyError):
+            return MISS
+        # The mtime of the entry directory orders entries for eviction
+        os.utime(entry)
+        return result
+
+    # Only the DataFrame cached under key, or MISS
+    def data(self, key):
+        try:
+            return pd.read_parquet(os.path.join(self.root, key, 'data.parquet'))
+        except (OSError, ValueError):
+            return MISS
+
+    # Store result, the data, metadata and stats of the file at path or None
+    # if it was discarded. The data may be None to store just the metadata
+    # and stats, and a later put() with the data completes the entry.
+    def put(self, key, path, result):
+        info = {'path': os.path.abspath(path), 'discarded': result is None}
+        data = None
+        if result is not None:
+            data, info['metadata'], info['stats'] = result
+        try:
+            encoded = json.dumps(info)
+        except TypeError:
+            # Stats or metadata which can't be represented in JSON are simply
+            # not cached
+            return
+
+        entry = os.path.join(self.root, key)
+        tmp = f'{entry}.{os.getpid()}.tmp'
+        os.makedirs(tmp, exist_ok=True)
+        if data is not None:
+            try:
+                data.to_parquet(os.path.join(tmp, 'data.parquet'))
+            except (ValueError, TypeError, NotImplementedError):
+                # Nor are frames Parquet can't store, such as ones with object
+                # columns of mixed types
+                shutil.rmtree(tmp, ignore_errors=True)
+                return
+        with open(os.path.join(tmp, 'info.json'), 'w') as f:
+            f.write(encoded)
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            # Another worker stored the same entry first, or it was stored
+            # without data, which is then added to it
+            stored = os.path.join(entry, 'data.parquet')
+            if data is not None and os.path.isdir(entry) and \
+                    not os.path.exists(stored):
+                try:
+                    os.replace(os.path.join(tmp, 'data.parquet'), stored)
+                except OSError:
+                    pass
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def entries(self):
+        for key in os.listdir(self.root):
+            entry = os.path.join(self.root, key)
+            if key.endswith('.tmp') or not os.path.isdir(entry):
+                continue
+            yield entry
+
+    def size(self, entry):
+        return sum(os.path.getsize(os.path.join(entry, name))
+                   for name in os.listdir(entry))
+
+    # Remove least recently used entries until the cache is under max_bytes
+    def evict(self):
+        if self.max_bytes is None:
+            return
+        entries = sorted((os.path.getmtime(entry), self.size(entry), entry)
+                         for entry in self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    # Remove the entries for the result file at path or, when no path is
+    # given, every entry
+    def invalidate(self, path=None):
+        target = os.path.abspath(path) if path is not None else None
+        for entry in list(self.entries()):
+            if target is not None:
+                try:
+                    with open(os.path.join(entry, 'info.json')) as f:
+                        if json.load(f)['path'] != target:
+                            continue
+                except (OSError, ValueError):
+                    pass
+            shutil.rmtree(entry, ignore_errors=True)
+
+
+def fingerprint(*exprs):
+    """
+    Hash the expressions used to load a file so that cached entries made with
+    different expressions are not reused. Functions are identified by their
+    name, their code (including the names it uses and any nested functions)
+    and the values they close over, so editing a function in a notebook or
+    making one with different arguments to a factory changes the
+    fingerprint.
+    """
+    h = hashlib.sha1()
+    seen = set()
+
+    def feed_code(code):
+        h.update(code.co_code)
+        h.update(repr(code.co_names).encode())
+        for const in code.co_consts:
+            if isinstance(const, types.CodeType):
+                feed_code(const)
+            else:
+                h.update(repr(const).encode())
+
+    def feed(expr):
+        if isinstance(expr, dict):
+            for k in sorted(expr):
+                h.update(repr(k).encode())
+                feed(expr[k])
+        elif isinstance(expr, (list, tuple)):
+            for item in expr:
+                feed(item)
+        elif hasattr(expr, '__code__'):
+            h.update(f'{expr.__module__}.{expr.__qualname__}'.encode())
+            # A function closing over itself, such as a recursive one
+            if id(expr) in seen:
+                return
+            seen.add(id(expr))
+            feed_code(expr.__code__)
+            feed(getattr(expr, '__defaults__', None))
+            for cell in getattr(expr, '__closure__', None) or ():
+                try:
+                    feed(cell.cell_contents)
+                except ValueError:
+                    # An empty cell, e.g. a name not assigned yet
+                    h.update(b'<empty>')
+        else:
+            h.update(repr(expr).encode())
+
+    for expr in exprs:
+        feed(expr)
+    return h.hexdigest()
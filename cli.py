@@ -0,0 +1,110 @@
+#!/usr/bin/python3
+
+import argparse
+import json
+import sys
+
+# Print the tree of a results directory as text, JSON or a summary table
+# without plotting anything, e.g. from cron or CI:
+#
+#   python cli.py run_data --discard machine_disk_caching=ReadOnly \
+#       --part machine_instance_type,machine_disk_limits_size \
+#       --part benchmark_config_scale --format summary
+#
+# Only the metadata of each file is loaded (just its "metadata" object with
+# ijson) and matplotlib and the plotting renderers are never imported. The
+# rest of bencharts is imported only once the arguments have been parsed.
+# With --cache, the metadata is stored in a RunCache (without any data) and
+# files which have not changed are not parsed on the next run.
+
+
+# An attribute value given on the command line: JSON if it parses as such, so
+# that numbers compare equal to numbers, otherwise the string itself
+def value(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+# A Filter matching ATTR=VALUE[,VALUE...]
+def condition(spec):
+    from filters import attr
+    name, _, values = spec.partition('=')
+    values = [value(v) for v in values.split(',')]
+    if len(values) == 1:
+        return attr(name) == values[0]
+    return attr(name).isin(values)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Print the tree of Runs in a results directory')
+    parser.add_argument('results')
+    parser.add_argument('--metadata', default='metadata',
+                        help='dotted path of the metadata in each file')
+    parser.add_argument('--discard', action='append', default=[],
+                        metavar='ATTR=VALUE[,VALUE...]',
+                        help='discard Runs with one of these values')
+    parser.add_argument('--keep', action='append', default=[],
+                        metavar='ATTR=VALUE[,VALUE...]',
+                        help='discard Runs without one of these values')
+    parser.add_argument('--part', action='append', default=[],
+                        metavar='ATTR[,ATTR...]',
+                        help='partition Runs by these attributes, in order')
+    parser.add_argument('--ignore', action='append', default=[],
+                        metavar='ATTR', help='attributes not to group by')
+    parser.add_argument('--occlude', action='append', default=[],
+                        metavar='ATTR', help='attributes not to show')
+    parser.add_argument('--relabel', action='append', default=[],
+                        metavar='ATTR=NAME')
+    parser.add_argument('--format', choices=['text', 'json', 'summary'],
+                        default='text')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--cache',
+                        help='directory of a RunCache to keep the metadata '
+                             'of each file in between runs')
+    return parser.parse_args(argv)
+
+
+def main(argv=None, out=sys.stdout):
+    args = parse_args(argv)
+
+    from benchart import BenchArt
+    from binary import PathExpr
+    from cache import RunCache
+    from loader import Loader
+    import tree
+
+    cache = RunCache(args.cache) if args.cache else None
+    loader = Loader(args.results, cache=cache)
+    for spec in args.discard:
+        loader.discard(condition(spec))
+    for spec in args.keep:
+        loader.discard(~condition(spec))
+    runs = loader.run({}, PathExpr(args.metadata), None, None,
+                      workers=args.workers, lazy=True)
+    if not runs:
+        return 1
+
+    benchart = BenchArt(runs)
+    parts = [spec.split(',') for spec in args.part]
+    for attrs in parts:
+        benchart.part(None, *attrs)
+    if args.ignore or args.occlude:
+        benchart.ignore(*args.ignore, *args.occlude)
+    root = benchart.run()
+
+    relabels = dict(spec.split('=', 1) for spec in args.relabel)
+    if args.format == 'text':
+        tree.write_text(root, out, set(args.occlude), relabels)
+    elif args.format == 'json':
+        tree.write_json(root, out, set(args.occlude), relabels)
+    else:
+        tree.write_summary(root, out, [attr for attrs in parts for attr in attrs],
+                           relabels)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,60 @@
+import numpy as np
+
+# Downsampling of a line to a target number of points which preserves its
+# visual shape. Both functions take the x and y values of the line as NumPy
+# arrays, with x sorted, and return the sorted positions of the points to
+# keep.
+
+
+def minmax(x, y, buckets):
+    """
+    Split the x range into buckets of equal width (e.g. one per pixel) and
+    keep the smallest and largest y in each, along with the first and last
+    point. Peaks and troughs are never lost.
+    """
+    if len(x) <= 2 * buckets:
+        return np.arange(len(x))
+    span = x[-1] - x[0]
+    if span <= 0:
+        bins = np.zeros(len(x), dtype=np.intp)
+    else:
+        bins = np.minimum(((x - x[0]) / span * buckets).astype(np.intp), buckets - 1)
+
+    order = np.lexsort((y, bins))
+    sorted_bins = bins[order]
+    starts = np.flatnonzero(np.r_[True, sorted_bins[1:] != sorted_bins[:-1]])
+    ends = np.r_[starts[1:], len(order)] - 1
+    keep = np.concatenate((order[starts], order[ends], [0, len(x) - 1]))
+    return np.unique(keep)
+
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets: keep the first and last point and, from
+    each of threshold - 2 equally sized buckets in between, the point forming
+    the largest triangle with the point kept from the previous bucket and the
+    average of the next bucket.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.intp)
+    keep = np.empty(threshold, dtype=np.intp)
+    keep[0] = 0
+    keep[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], max(edges[i + 2], edges[i + 1] + 1)
+        else:
+            next_start, next_end = n - 1, n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) -
+                      (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        keep[i + 1] = a
+    return np.unique(keep)
@@ -0,0 +1,211 @@
+import operator
+from abc import ABC, abstractmethod
+import numpy as np
+from metadata import MISSING, MetadataRow, factorize, unwrap
+
+# Declarative filters over flattened metadata attributes, e.g.
+#
+#   (attr('machine_instance_type') == 'Standard_D16ds_v4') &
+#       attr('machine_disk_limits_size').isin(['p30', 'p40'])
+#
+# A Filter can be called on the flattened metadata of a single Run, or
+# evaluated for many Runs at once with mask(). Each comparison is only made
+# once per distinct value of its attribute and then broadcast to all Runs
+# through their categorical codes. Attributes which a Run doesn't have,
+# whether absent from its metadata or MISSING, are treated as None.
+
+
+class Filter(ABC):
+    """
+    A boolean expression over metadata attributes. Combine Filters with &, |
+    and ~.
+    """
+    def __and__(self, other):
+        return And(self, other)
+
+    def __or__(self, other):
+        return Or(self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+    # The names of all attributes the filter uses
+    @abstractmethod
+    def attrs(self):
+        pass
+
+    # Whether the flattened metadata of a single Run matches
+    @abstractmethod
+    def __call__(self, metadata):
+        pass
+
+    # A boolean array with one entry per row of columns, a MetadataTable or
+    # anything else with keys, columns, categories and codes like it
+    @abstractmethod
+    def mask(self, columns):
+        pass
+
+
+class Compare(Filter):
+    def __init__(self, name, op, symbol, value):
+        self.name = name
+        self.op = op
+        self.symbol = symbol
+        self.value = value
+
+    def attrs(self):
+        return {self.name}
+
+    def test(self, value):
+        if value is MISSING:
+            value = None
+        try:
+            return bool(self.op(value, self.value))
+        except TypeError:
+            return False
+
+    def __call__(self, metadata):
+        return self.test(metadata.get(self.name))
+
+    def mask(self, columns):
+        if self.name not in columns.columns:
+            return np.full(len(columns.codes), self.test(None))
+        j = columns.columns[self.name]
+        matches = np.fromiter((self.test(value) for value in columns.categories[j]),
+                              dtype=bool, count=len(columns.categories[j]))
+        return matches[columns.codes[:, j]]
+
+    def __repr__(self):
+        return f'(attr({self.name!r}) {self.symbol} {self.value!r})'
+
+
+def isin(value, values):
+    return value in values
+
+
+def isna(value, _):
+    return value is None or value is MISSING or value == '' or \
+        (isinstance(value, float) and np.isnan(value))
+
+
+class And(Filter):
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+
+    def attrs(self):
+        return self.left.attrs() | self.right.attrs()
+
+    def __call__(self, metadata):
+        return self.left(metadata) and self.right(metadata)
+
+    def mask(self, columns):
+        return self.left.mask(columns) & self.right.mask(columns)
+
+    def __repr__(self):
+        return f'({self.left!r} & {self.right!r})'
+
+
+class Or(And):
+    def __call__(self, metadata):
+        return self.left(metadata) or self.right(metadata)
+
+    def mask(self, columns):
+        return self.left.mask(columns) | self.right.mask(columns)
+
+    def __repr__(self):
+        return f'({self.left!r} | {self.right!r})'
+
+
+class Not(Filter):
+    def __init__(self, inner):
+        self.inner = inner
+
+    def attrs(self):
+        return self.inner.attrs()
+
+    def __call__(self, metadata):
+        return not self.inner(metadata)
+
+    def mask(self, columns):
+        return ~self.inner.mask(columns)
+
+    def __repr__(self):
+        return f'~{self.inner!r}'
+
+
+class attr:
+    """
+    A flattened metadata attribute, e.g. attr('machine_instance_type'), to be
+    compared to build a Filter.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __eq__(self, value):
+        return Compare(self.name, operator.eq, '==', value)
+
+    def __ne__(self, value):
+        return Compare(self.name, operator.ne, '!=', value)
+
+    def __lt__(self, value):
+        return Compare(self.name, operator.lt, '<', value)
+
+    def __le__(self, value):
+        return Compare(self.name, operator.le, '<=', value)
+
+    def __gt__(self, value):
+        return Compare(self.name, operator.gt, '>', value)
+
+    def __ge__(self, value):
+        return Compare(self.name, operator.ge, '>=', value)
+
+    def isin(self, values):
+        return Compare(self.name, isin, 'in', tuple(values))
+
+    # MISSING, None, NaN or an empty string
+    def isna(self):
+        return Compare(self.name, isna, 'is', None)
+
+    __hash__ = None
+
+
+class Columns:
+    """
+    The categorical codes of only some attributes of many Runs, built for
+    Runs which don't share a MetadataTable so that a Filter can be evaluated
+    on them without building a table of every attribute.
+    """
+    def __init__(self, metadatas, keys):
+        self.keys = sorted(keys)
+        self.columns = {key: j for j, key in enumerate(self.keys)}
+        self.categories = []
+        self.codes = np.empty((len(metadatas), len(self.keys)), dtype=np.intp)
+        for j, key in enumerate(self.keys):
+            codes, uniques = factorize([unwrap(metadata).get(key, MISSING)
+                                        for metadata in metadatas])
+            self.codes[:, j] = codes
+            self.categories.append(uniques)
+
+
+def mask(runs, where):
+    """
+    Evaluate the Filter where for runs at once. Runs whose metadata was
+    compacted into one MetadataTable are filtered on its codes directly.
+    """
+    runs = list(runs)
+    if not runs:
+        return np.zeros(0, dtype=bool)
+    mappings = [run.metadata.metadata for run in runs]
+    table = getattr(mappings[0], 'table', None)
+    if all(isinstance(m, MetadataRow) and m.table is table for m in mappings):
+        return where.mask(table)[[m.row for m in mappings]]
+    return where.mask(Columns([run.metadata for run in runs], where.attrs()))
+
+
+def select(runs, where):
+    """
+    The runs, already loaded, which match the Filter where
+    """
+    runs = list(runs)
+    return [run for run, keep in zip(runs, mask(runs, where)) if keep]
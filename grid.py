@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+from stats import stack, to_timedelta
+
+# Resampling of many Runs onto one shared grid of fixed-interval time bins.
+# The data of all the Runs is stacked and binned at once, so that Runs can be
+# compared point by point without interpolating each one against the others'
+# timelines.
+
+HOWS = {'mean', 'last', 'sum', 'min', 'max', 'first'}
+
+
+class Aligned:
+    """
+    The data of runs on a common time grid as a runs x times x metrics array.
+    times holds the start of each bin relative to the start of each Run. Bins
+    in which a Run has no samples of a metric are NaN.
+    """
+    def __init__(self, runs, times, metrics, values):
+        self.runs = runs
+        self.times = times
+        self.metrics = metrics
+        self.values = values
+        self.positions = {run: i for i, run in enumerate(runs)}
+
+    def __repr__(self):
+        return (f'Aligned({len(self.runs)} runs x {len(self.times)} times x '
+                f'{len(self.metrics)} metrics)')
+
+    # One metric as a DataFrame of times by run id
+    def frame(self, metric):
+        j = self.metrics.index(metric)
+        return pd.DataFrame(self.values[:, :, j].T, index=self.times,
+                            columns=pd.Index(self.runs, name='run'))
+
+    # The metrics of one Run (or run id) as a DataFrame indexed by time
+    def run(self, run):
+        i = self.positions[getattr(run, 'id', run)]
+        return pd.DataFrame(self.values[i], index=self.times, columns=self.metrics)
+
+    def series(self, run, metric):
+        i = self.positions[getattr(run, 'id', run)]
+        return pd.Series(self.values[i, :, self.metrics.index(metric)],
+                         index=self.times, name=metric)
+
+
+def align(runs, interval, how='mean', columns=None, fill=None):
+    """
+    Resample the data of runs onto bins of interval (seconds, a Timedelta or
+    a string like '5s') starting at relative time 0, aggregating the samples
+    in each bin with how (one of HOWS). Only numeric columns are used unless
+    columns is given. With fill='linear', missing bins between a Run's first
+    and last sample of a metric are filled by linear interpolation, for all
+    Runs and metrics at once.
+    """
+    if how not in HOWS:
+        raise ValueError(f'Unknown aggregation {how!r}')
+    interval = to_timedelta(interval)
+    runs = list(runs)
+    ids = [run.id for run in runs]
+
+    data = stack(runs, columns)
+    if columns is None:
+        data = data.select_dtypes('number')
+    metrics = list(data.columns)
+
+    times = data.index.get_level_values('relative_time')
+    bins = pd.TimedeltaIndex(times).as_unit('ns').asi8 // interval.value
+    positions = pd.Index(ids).get_indexer(data.index.get_level_values('run'))
+    nbins = int(bins.max()) + 1 if len(bins) else 0
+
+    values = np.full((len(ids), nbins, len(metrics)), np.nan)
+    if len(data):
+        grouped = data.astype(float).groupby([positions, bins], sort=False).agg(how)
+        rows = grouped.index.get_level_values(0).to_numpy()
+        cols = grouped.index.get_level_values(1).to_numpy()
+        values[rows, cols] = grouped.to_numpy(dtype=float)
+        if how == 'sum':
+            # Bins without samples sum to 0, but they should stay missing
+            counts = data.notna().groupby([positions, bins], sort=False).sum()
+            values[rows, cols] = np.where(counts.to_numpy() > 0,
+                                          values[rows, cols], np.nan)
+
+    if fill == 'linear' and nbins:
+        flat = pd.DataFrame(values.transpose(1, 0, 2).reshape(nbins, -1))
+        flat = flat.interpolate(method='linear', limit_area='inside')
+        values = flat.to_numpy().reshape(nbins, len(ids), len(metrics)).transpose(1, 0, 2)
+
+    grid = pd.TimedeltaIndex((np.arange(nbins) * interval.value).view('m8[ns]'),
+                             name='relative_time')
+    return Aligned(ids, grid, metrics, np.ascontiguousarray(values))
+
+
+def align_group(run_group, interval, how='mean', columns=None, fill=None):
+    """
+    align() the Runs of run_group and all RunGroups under it. The result is
+    cached on the RunGroup until its Runs or metadata change.
+    """
+    runs = list(run_group.iterruns())
+    key = (tuple(run.id for run in runs), to_timedelta(interval), how,
+           None if columns is None else tuple(columns), fill)
+    if key not in run_group.aligned:
+        run_group.aligned[key] = align(runs, interval, how, columns, fill)
+    return run_group.aligned[key]
@@ -0,0 +1,236 @@
+// The viewer of pages written by interactive.py. SPEC lists the figures, the
+// plots in each and the series (a column of a Run) in each plot. Every plot is
+// drawn on a canvas from tiles of the min/max pyramid of each series: for the
+// part of the timeline in view, the coarsest level with at least a bucket per
+// pixel is used, so each redraw fetches about as many buckets as the canvas
+// is wide. The plots of a figure share their x axis. Scroll to zoom, drag to
+// pan and double click to show the whole timeline again.
+(function () {
+  'use strict';
+
+  const COLORS = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd',
+                  '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf'];
+  const HEIGHT = 240;
+  const MARGIN = {left: 60, right: 10, top: 10, bottom: 24};
+  const tiles = new Map();
+
+  function tile(series, level, index) {
+    const url = ['tiles', encodeURIComponent(series.run),
+                 encodeURIComponent(series.path), level, index + '.json'].join('/');
+    if (!tiles.has(url)) {
+      tiles.set(url, fetch(url).then(r => r.ok ? r.json() : null)
+                               .catch(() => null));
+    }
+    return tiles.get(url);
+  }
+
+  // The coarsest level of series with at least a bucket per pixel of span
+  function levelFor(series, span, pixels) {
+    let level = 0;
+    while (level + 1 < series.levels &&
+           span / (series.base * 2 ** (level + 1)) >= pixels) {
+      level++;
+    }
+    return level;
+  }
+
+  // The buckets of series from start to end (seconds) as
+  // [{t, min, max, mean}], fetching the tiles they are in
+  async function buckets(series, start, end, pixels) {
+    const level = levelFor(series, end - start, pixels);
+    const width = series.base * 2 ** level;
+    const count = Math.ceil(series.buckets / 2 ** level);
+    const first = Math.max(Math.floor(start / width), 0);
+    const last = Math.min(Math.ceil(end / width), count - 1);
+    const size = SPEC.tile;
+    const wanted = [];
+    for (let i = Math.floor(first / size); i <= Math.floor(last / size); i++) {
+      wanted.push(tile(series, level, i));
+    }
+    const result = [];
+    for (const t of await Promise.all(wanted)) {
+      if (!t) continue;
+      for (let i = 0; i < t.min.length; i++) {
+        const bucket = t.start + i;
+        if (bucket < first || bucket > last || t.min[i] === null) continue;
+        result.push({t: (bucket + 0.5) * width, min: t.min[i], max: t.max[i],
+                     mean: t.mean[i]});
+      }
+    }
+    return result;
+  }
+
+  function mmss(seconds) {
+    const s = Math.floor(seconds);
+    return String(Math.floor(s / 60)).padStart(2, '0') + ':' +
+      String(s % 60).padStart(2, '0');
+  }
+
+  class Plot {
+    constructor(figure, plot, parent) {
+      this.figure = figure;
+      this.plot = plot;
+      this.canvas = document.createElement('canvas');
+      this.canvas.height = HEIGHT;
+      this.canvas.style.width = '100%';
+      this.canvas.style.height = HEIGHT + 'px';
+      this.canvas.style.cursor = 'grab';
+      this.generation = 0;
+      parent.appendChild(this.canvas);
+
+      this.canvas.addEventListener('wheel', event => {
+        event.preventDefault();
+        const [start, end] = figure.view;
+        const at = this.time(event.offsetX);
+        const factor = event.deltaY < 0 ? 0.8 : 1.25;
+        figure.setView(at - (at - start) * factor, at + (end - at) * factor);
+      });
+      this.canvas.addEventListener('mousedown', event => {
+        const x = event.clientX;
+        const [start, end] = figure.view;
+        const scale = (end - start) / this.plotWidth();
+        const move = e => figure.setView(start - (e.clientX - x) * scale,
+                                         end - (e.clientX - x) * scale);
+        const up = () => {
+          window.removeEventListener('mousemove', move);
+          window.removeEventListener('mouseup', up);
+        };
+        window.addEventListener('mousemove', move);
+        window.addEventListener('mouseup', up);
+      });
+      this.canvas.addEventListener('dblclick', () => figure.setView(0, figure.extent));
+    }
+
+    plotWidth() {
+      return Math.max(this.canvas.width - MARGIN.left - MARGIN.right, 1);
+    }
+
+    time(offsetX) {
+      const [start, end] = this.figure.view;
+      const x = offsetX * this.canvas.width / this.canvas.clientWidth - MARGIN.left;
+      return start + x / this.plotWidth() * (end - start);
+    }
+
+    async draw() {
+      const generation = ++this.generation;
+      this.canvas.width = this.canvas.clientWidth || 800;
+      const [start, end] = this.figure.view;
+      const width = this.plotWidth();
+      const data = await Promise.all(this.plot.series.map(
+        series => buckets(series, start, end, width)));
+      // A newer view was drawn while the tiles of this one were fetched
+      if (generation !== this.generation) return;
+
+      let low = Infinity, high = -Infinity;
+      for (const series of data) {
+        for (const b of series) {
+          low = Math.min(low, b.min);
+          high = Math.max(high, b.max);
+        }
+      }
+      if (low === Infinity) { low = 0; high = 1; }
+      if (low === high) { low -= 1; high += 1; }
+
+      const ctx = this.canvas.getContext('2d');
+      const height = HEIGHT - MARGIN.top - MARGIN.bottom;
+      const x = t => MARGIN.left + (t - start) / (end - start) * width;
+      const y = v => MARGIN.top + (high - v) / (high - low) * height;
+      ctx.clearRect(0, 0, this.canvas.width, this.canvas.height);
+
+      ctx.save();
+      ctx.beginPath();
+      ctx.rect(MARGIN.left, MARGIN.top, width, height);
+      ctx.clip();
+      data.forEach((series, i) => {
+        const color = this.figure.colors.get(this.plot.series[i].run);
+        // The range of each bucket as a faint band, its mean as a line
+        ctx.globalAlpha = 0.25;
+        ctx.strokeStyle = color;
+        ctx.beginPath();
+        for (const b of series) {
+          ctx.moveTo(x(b.t), y(b.min));
+          ctx.lineTo(x(b.t), y(b.max) - 0.5);
+        }
+        ctx.stroke();
+        ctx.globalAlpha = 1;
+        ctx.beginPath();
+        series.forEach((b, j) => j ? ctx.lineTo(x(b.t), y(b.mean))
+                                   : ctx.moveTo(x(b.t), y(b.mean)));
+        ctx.stroke();
+      });
+      ctx.restore();
+
+      ctx.fillStyle = '#000';
+      ctx.strokeStyle = '#000';
+      ctx.strokeRect(MARGIN.left, MARGIN.top, width, height);
+      ctx.font = '11px sans-serif';
+      ctx.textAlign = 'center';
+      for (let k = 0; k <= 5; k++) {
+        const t = start + (end - start) * k / 5;
+        ctx.fillText(mmss(t), x(t), HEIGHT - 8);
+      }
+      ctx.textAlign = 'right';
+      for (let k = 0; k <= 4; k++) {
+        const v = low + (high - low) * k / 4;
+        ctx.fillText(v.toPrecision(4), MARGIN.left - 4, y(v) + 4);
+      }
+      ctx.save();
+      ctx.translate(12, MARGIN.top + height / 2);
+      ctx.rotate(-Math.PI / 2);
+      ctx.textAlign = 'center';
+      ctx.fillText(this.plot.subject, 0, 0);
+      ctx.restore();
+    }
+  }
+
+  class Figure {
+    constructor(figure, parent) {
+      const section = document.createElement('section');
+      const title = document.createElement('pre');
+      title.textContent = figure.title;
+      section.appendChild(title);
+      parent.appendChild(section);
+
+      this.extent = 0;
+      const runs = new Map();
+      for (const plot of figure.plots) {
+        for (const series of plot.series) {
+          this.extent = Math.max(this.extent, series.base * series.buckets);
+          runs.set(series.run, series.label);
+        }
+      }
+      this.view = [0, this.extent || 1];
+      this.plots = figure.plots.filter(plot => plot.series.length)
+                               .map(plot => new Plot(this, plot, section));
+
+      const legend = document.createElement('ul');
+      legend.style.fontFamily = 'sans-serif';
+      legend.style.fontSize = '12px';
+      this.colors = new Map();
+      [...runs].forEach(([run, label], i) => {
+        this.colors.set(run, COLORS[i % COLORS.length]);
+        const item = document.createElement('li');
+        item.style.color = this.colors.get(run);
+        item.textContent = label;
+        legend.appendChild(item);
+      });
+      section.appendChild(legend);
+    }
+
+    setView(start, end) {
+      const span = Math.max(Math.min(end - start, this.extent || 1), 0.001);
+      start = Math.min(Math.max(start, 0), Math.max((this.extent || 1) - span, 0));
+      this.view = [start, start + span];
+      this.draw();
+    }
+
+    draw() {
+      this.plots.forEach(plot => plot.draw());
+    }
+  }
+
+  const parent = document.getElementById('figures');
+  const figures = SPEC.figures.map(figure => new Figure(figure, parent));
+  figures.forEach(figure => figure.draw());
+  window.addEventListener('resize', () => figures.forEach(f => f.draw()));
+})();
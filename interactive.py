@@ -0,0 +1,258 @@
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import json
+import math
+import os
+import shutil
+import urllib.parse
+from benchart import Run
+import pyramid
+from renderer import LeafParentRenderer, Renderer, do_relabel_str, extra_title_expr
+from timing import as_report
+
+# An interactive HTML backend for the renderer chain. HtmlFigureRenderer and
+# HtmlPlotRenderer take the places of MultiAxesRenderer and PlotRenderer, but
+# instead of drawing every point they only record which Runs and columns go
+# in which plot of which figure in an HtmlPage. The page (see interactive.js)
+# draws each plot on a canvas from tiles of the Runs' min/max pyramids (see
+# pyramid.py), fetching those of the coarsest level which has a bucket per
+# pixel of the part of the timeline in view, so zooming into a minute of a
+# three hour Run fetches about as much data as showing all of it.
+#
+# Tiles are read from tiles/<run>/<column>/<level>/<index>.json, answered
+# from the pyramids in memory by serve() or, for a static file server,
+# written ahead of time by HtmlPage.write(). Writing them takes a file per
+# tile of every column of every Run, which for many long Runs is millions of
+# files, so it is only done when asked for.
+
+# The number of buckets in a tile
+TILE = 512
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'interactive.js')
+
+
+class HtmlPage:
+    """
+    The figures of an interactive page and the pyramids of the Runs in them,
+    by run id.
+    """
+    def __init__(self, tile=TILE):
+        self.tile_size = tile
+        self.figures = []
+        self.pyramids = {}
+
+    # The pyramid of run, built from its data unless the loader already did
+    def pyramid(self, run):
+        key = str(run.id)
+        if key not in self.pyramids:
+            if run.pyramid is not None:
+                self.pyramids[key] = run.pyramid
+            else:
+                self.pyramids[key] = pyramid.build(run.all_data)
+                run.release()
+        return self.pyramids[key]
+
+    # One tile of buckets of a column of a Run's pyramid at level, with the
+    # min, max and mean of each bucket (None where it has no samples), or
+    # None if there is no such tile
+    def tile(self, run, column, level, index):
+        p = self.pyramids.get(str(run))
+        if p is None or column not in p.positions or not 0 <= level < len(p):
+            return None
+        first = index * self.tile_size
+        if not 0 <= first < p.sizes[level]:
+            return None
+        last = first + self.tile_size
+        stats = p.stats(column, level)
+        count = stats['count'][first:last]
+        mean = stats['sum'][first:last] / count.clip(min=1)
+        return {
+            'level': level,
+            'index': index,
+            'start': first,
+            'min': nulls(stats['min'][first:last], count),
+            'max': nulls(stats['max'][first:last], count),
+            'mean': nulls(mean, count),
+        }
+
+    def spec(self):
+        return {'tile': self.tile_size, 'figures': self.figures}
+
+    # Write index.html and the viewer to outdir and, with tiles, every tile
+    # of every pyramid, so that the page works from any static file server
+    def write(self, outdir, tiles=False, report=None):
+        report = as_report(report)
+        os.makedirs(outdir, exist_ok=True)
+        shutil.copy(SCRIPT, os.path.join(outdir, 'interactive.js'))
+        with open(os.path.join(outdir, 'index.html'), 'w') as f:
+            f.write('<!DOCTYPE html>\n<html><head><meta charset="utf-8">'
+                    '<title>bencharts</title></head><body>\n'
+                    '<div id="figures"></div>\n<script>const SPEC = ')
+            # Keep the JSON from closing the script element
+            f.write(json.dumps(self.spec()).replace('</', '<\\/'))
+            f.write(';</script>\n<script src="interactive.js"></script>\n'
+                    '</body></html>\n')
+        if not tiles:
+            return
+        with report.phase('tiles'):
+            for key, p in self.pyramids.items():
+                for column in p.columns:
+                    for level, size in enumerate(p.sizes):
+                        directory = os.path.join(outdir, 'tiles', key,
+                                                 quote(column), str(level))
+                        os.makedirs(directory, exist_ok=True)
+                        for index in range(math.ceil(size / self.tile_size)):
+                            with open(os.path.join(directory, f'{index}.json'), 'w') as f:
+                                f.write(json.dumps(self.tile(key, column, level, index)))
+                            report.count('tiles')
+
+
+# The values of a tile as a list, with None for buckets without samples
+def nulls(values, count):
+    values = values.astype(object)
+    values[count == 0] = None
+    return values.tolist()
+
+
+# A column name as a single component of a tile path, the same as
+# encodeURIComponent(). The page quotes it once more in URLs.
+def quote(column):
+    return urllib.parse.quote(column, safe="!'()*-._~")
+
+
+class HtmlFigureRenderer(Renderer):
+    """
+    Renders a leaf parent RunGroup as a figure of an HtmlPage with one plot
+    per subject, in place of MultiAxesRenderer.
+    """
+    def __init__(self, page, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.page = page
+
+    def __call__(self, renderers, run_group, axes_subjects, title=''):
+        figure = {'title': title,
+                  'plots': [{'subject': subject, 'series': []}
+                            for subject in axes_subjects]}
+        renderer, *renderers = renderers
+        for plot in figure['plots']:
+            for child in run_group.children:
+                renderer(renderers, child, plot, plot['subject'])
+        self.page.figures.append(figure)
+        self.report.count('figures')
+        return figure
+
+
+class HtmlPlotRenderer(Renderer):
+    """
+    Adds the subject column of a Run, or of every Run under a RunGroup, to a
+    plot of an HtmlPage, in place of PlotRenderer.
+    """
+    def __init__(self, page, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.page = page
+
+    def __call__(self, renderers, run_group, plot, subject=None, set_title=False,
+                 indent=0):
+        if not isinstance(run_group, Run):
+            for run in run_group.iterruns():
+                self(renderers, run, plot, subject, indent=indent + 2)
+            return
+
+        run = run_group
+        with self.report.phase('series'):
+            p = self.page.pyramid(run)
+        if subject not in p.positions or not len(p):
+            return
+        plot['series'].append({
+            'run': str(run.id),
+            'column': subject,
+            'path': quote(subject),
+            'label': self.label(run),
+            'base': p.base.total_seconds(),
+            'levels': len(p),
+            'buckets': p.sizes[0],
+        })
+
+    def label(self, run):
+        prefix = f'Run {run.id}'
+        subset = run.label_metadata(self.occludes)
+        if not subset:
+            return prefix
+        return prefix + ': ' + do_relabel_str(subset, self.relabels)
+
+
+def export_html(benchart, outdir, sorted_prefixes, relabels,
+                extra_title_expr=extra_title_expr, tiles=False, groups=None,
+                profile=None):
+    """
+    Like export_multi() but writes one interactive page of every leaf parent
+    RunGroup's figure to outdir instead of images. serve() the returned
+    HtmlPage to view it. With tiles, all tiles are written too, a file each,
+    and the page can be opened from any static file server (e.g. python -m
+    http.server).
+    """
+    report = as_report(profile)
+    if groups is None:
+        with report.phase('run'):
+            root = benchart.run()
+    else:
+        root = benchart.tree.children[0]
+
+    page = HtmlPage()
+    renderers = [
+        LeafParentRenderer(root.metadata, relabels=relabels,
+                           extra_title_expr=extra_title_expr, only=groups),
+        HtmlFigureRenderer(page),
+        HtmlPlotRenderer(page, occludes=benchart.ignores, relabels=relabels),
+    ]
+    for renderer in renderers:
+        renderer.report = report
+    with report.phase('render'):
+        renderers[0](renderers[1:], root, sorted_prefixes=sorted_prefixes)
+    with report.phase('write'):
+        page.write(outdir, tiles, report)
+    return page
+
+
+class TileHandler(SimpleHTTPRequestHandler):
+    """
+    Serves the files of a page and answers tile requests from its pyramids.
+    """
+    def __init__(self, page, *args, **kwargs):
+        self.page = page
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self):
+        path = urllib.parse.urlsplit(self.path).path
+        parts = path.strip('/').split('/')
+        if len(parts) != 5 or parts[0] != 'tiles':
+            return super().do_GET()
+        _, run, column, level, index = parts
+        try:
+            column = urllib.parse.unquote(urllib.parse.unquote(column))
+            tile = self.page.tile(run, column, int(level),
+                                  int(index.removesuffix('.json')))
+        except ValueError:
+            tile = None
+        if tile is None:
+            return self.send_error(404)
+        body = json.dumps(tile).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(page, outdir, host='127.0.0.1', port=8000):
+    """
+    A local server of page, written to outdir without tiles, which computes
+    tiles as they are requested. Call serve_forever() on it.
+    """
+    page.write(outdir, tiles=False)
+    handler = partial(TileHandler, page, directory=outdir)
+    return ThreadingHTTPServer((host, port), handler)
+
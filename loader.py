@@ -1,13 +1,34 @@
 #!/usr/bin/python3
 
 from collections.abc import MutableMapping
+import collections
+from concurrent.futures import ProcessPoolExecutor
 import json
 import os
+import sys
 import functools as ft
+import numpy as np
 import pandas as pd
-from metadata import RunMetadata
+from pandas.api.extensions import take
+from cache import MISS, fingerprint
+from filters import Filter
+import pyramid
+from pyramid import PyramidStore
+from timing import NULL, Report, as_report
+try:
+    import ijson
+except ImportError:
+    ijson = None
+from metadata import (MISSING, MetadataRow, MetadataTable, RunMetadata, Schema,
+                      SchemaRow, sizeof, unwrap)
 from benchart import Run, RunMetadata
+from store import RunStore
 
+# How many lazily loaded DataFrames are kept in memory by default
+MAX_FRAMES = 16
+
+# How lists in metadata can be flattened, see flatten()
+ARRAYS = {None, 'index', 'tuple'}
 
 
 class Loader:
@@ -19,45 +40,350 @@ class Loader:
     not that file will be turned into a Run and appended to a list of runs.
     metadata from the input file is flattened. Nested JSON keys are joined
     together to create a composite key with a non-map value. This flattened
-    metadata is made into the RunMetadata.
+    metadata is made into the RunMetadata. arrays says how lists in it are
+    flattened (see flatten()).
     Finally, Runs are normalized. Each RunMetadata's keys is replaced with the
-    union of all distinct keys from all flattened RunMetadatas. The value of
-    new keys added to RunMetadatas which were previously absent is an empty
-    string.
+    union of all distinct keys from all flattened RunMetadatas, kept once in
+    a Schema shared by all of them. The value of keys which were previously
+    absent from a RunMetadata is MISSING.
     These two steps (flattening and normalizing) make it possible to diff and
     group Runs.
+    When ijson is installed and there are discards, loading is done in two
+    phases: only the "metadata" subtree of each file is parsed to run the
+    discards and metadata_expr on, and the rest of the file is parsed only for
+    runs which are kept. In that case discards and metadata_expr are passed a
+    dict with just the "metadata" key, or the whole file if they need more
+    than that (i.e. raise KeyError).
+    Given a RunCache, files which have not changed since they were last loaded
+    with the same expressions are read from the cache instead of parsed.
+    A discard may also be a Filter (see filters.py) over the flattened
+    metadata attributes. Filters are checked as soon as the metadata has been
+    flattened, which with ijson is before the rest of the file is parsed.
+    With profile (True or a timing.Report), the time of each phase of loading,
+    overall and per file, and counts of files, rows and bytes are recorded in
+    report.
+    With pyramids, each Run is given the Pyramid of its data (see pyramid.py)
+    for plotting and summaries. Given a PyramidStore as pyramids, they are
+    saved and only built again once a file or the data expressions change.
     """
 
-    def __init__(self, root):
+    def __init__(self, root, cache=None, arrays=None, profile=False):
+        if arrays not in ARRAYS:
+            raise ValueError(f'Unknown arrays {arrays!r}')
         self.root = root
+        # How lists in metadata are flattened, see flatten()
+        self.arrays = arrays
         self.discards = []
+        self.filters = []
+        self.cache = cache
+        # Paths of every file loaded or discarded so far
+        self.seen = set()
+        self.memory_report = None
+        self.report = as_report(profile)
+        # Where the file being loaded records its phases
+        self.timer = NULL
 
     def discard(self, discard_expr, *args, **kwargs):
+        if isinstance(discard_expr, Filter):
+            self.filters.append(discard_expr)
+            return
         self.discards.append((discard_expr, args, kwargs))
 
     def do_discard(self, all_info):
         return any(discard(all_info, *args, **kwargs) for discard, args, kwargs in self.discards)
 
-    def run(self, data_exprs, metadata_expr, stats_expr, timeline):
+    def do_filter(self, metadata):
+        return any(where(metadata) for where in self.filters)
+
+    # With workers other than 1, files are parsed, discarded and turned into
+    # DataFrames in a pool of worker processes (None uses every CPU). Files are
+    # visited in sorted order so Run ids are the same with or without a pool.
+    # With compact, numeric data columns are downcast where that is lossless
+    # and the metadata of all Runs is stored in a single MetadataTable. The
+    # memory used before and after is then kept in memory_report.
+    # With stacked, the data of all Runs is moved into a single RunStore.
+    # With lazy, only metadata and stats are loaded up front and each Run's
+    # data is built from its file when it is first used (see LazyData). At
+    # most max_frames of those DataFrames are kept in memory at once (None
+    # keeps every one). If stats_expr is also None, only the "metadata"
+    # object of each file is parsed when ijson is installed.
+    def run(self, data_exprs, metadata_expr, stats_expr, timeline, workers=1,
+            chunksize=1, interval=None, compact=False, stacked=False,
+            lazy=False, max_frames=MAX_FRAMES, pyramids=False):
+        if lazy and stacked:
+            raise ValueError('Lazily loaded data cannot be stacked')
+        paths = [os.path.join(self.root, datafile)
+                 for datafile in sorted(os.listdir(self.root))]
+        with self.report.phase('load'):
+            runs = self.load_all(paths, 1, data_exprs, metadata_expr,
+                                 stats_expr, timeline, workers, chunksize,
+                                 interval, lazy, max_frames, compact)
+        with self.report.phase('normalize'):
+            normalize(runs)
+
+        if compact:
+            with self.report.phase('compact'):
+                before = memory_usage(runs)
+                for run in runs:
+                    if run.data_source is None:
+                        run.all_data = downcast(run.all_data)
+                compact_metadata(runs)
+                after = memory_usage(runs)
+            self.memory_report = pd.DataFrame({'before': before, 'after': after})
+            self.memory_report['saved'] = \
+                self.memory_report['before'] - self.memory_report['after']
+        if pyramids:
+            with self.report.phase('pyramid'):
+                self.build_pyramids(runs, pyramids, data_exprs, timeline,
+                                    interval)
+        if stacked:
+            with self.report.phase('stack'):
+                RunStore(runs)
+        return runs
+
+    # Load only the files in the results directory which were not seen by a
+    # previous run() or update() and are not already among runs. Returns the
+    # new Runs, numbered after the existing ones. The metadata of both old and
+    # new Runs is widened so that all of them have the same keys.
+    def update(self, runs, data_exprs, metadata_expr, stats_expr, timeline,
+               workers=1, chunksize=1, interval=None, lazy=False,
+               max_frames=MAX_FRAMES, pyramids=False):
+        seen = self.seen | {run.filename for run in runs}
+        paths = [path for path in (os.path.join(self.root, datafile)
+                                   for datafile in sorted(os.listdir(self.root)))
+                 if path not in seen]
+        first_id = max((run.id for run in runs), default=0) + 1
+        with self.report.phase('load'):
+            new_runs = self.load_all(paths, first_id, data_exprs,
+                                     metadata_expr, stats_expr, timeline,
+                                     workers, chunksize, interval, lazy,
+                                     max_frames, False)
+        with self.report.phase('normalize'):
+            widen(runs, new_runs)
+        if pyramids:
+            with self.report.phase('pyramid'):
+                self.build_pyramids(new_runs, pyramids, data_exprs, timeline,
+                                    interval)
+        return new_runs
+
+    def load_all(self, paths, first_id, data_exprs, metadata_expr, stats_expr,
+                 timeline, workers, chunksize, interval, lazy, max_frames,
+                 compact):
+        exprs = None
+        if self.cache is not None:
+            exprs = fingerprint(data_exprs, metadata_expr, stats_expr, timeline,
+                                interval, self.discards, self.filters,
+                                self.arrays)
+        load = ft.partial(self.load, data_exprs, metadata_expr, stats_expr,
+                          timeline, interval, lazy, exprs)
+        source = None
+        if lazy:
+            source = LazyData(self, data_exprs, timeline, interval, exprs,
+                              max_frames, compact)
+
+        if workers == 1:
+            loaded = map(load, paths)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                loaded = list(executor.map(load, paths, chunksize=chunksize))
+
         runs = []
-        for i, datafile in enumerate(os.listdir(self.root)):
-            all_info = extract(os.path.join(self.root, datafile))
-            if self.do_discard(all_info):
+        for i, (path, result) in enumerate(zip(paths, loaded), first_id):
+            self.seen.add(path)
+            if self.report.enabled:
+                result, timer = result
+                self.report.merge(timer, file=path)
+            if result is None:
+                continue
+            data, metadata, stats = result
+            runs.append(Run(i, data, metadata, stats, path))
+            if source is not None:
+                runs[-1].data_source = source
+        if self.cache is not None:
+            self.cache.evict()
+        return runs
+
+    # Give every Run the Pyramid of its data (see pyramid.py). With a
+    # PyramidStore as store, pyramids saved by an earlier load are used
+    # instead, without touching the data, and new ones are saved. Lazily
+    # loaded data is released again once its pyramid is built.
+    def build_pyramids(self, runs, store, data_exprs, timeline, interval):
+        if not isinstance(store, PyramidStore):
+            store = None
+        exprs = fingerprint(data_exprs, timeline, interval)
+        for run in runs:
+            path = store.path(run.filename, exprs) if store is not None else None
+            run.pyramid = store.get(path) if store is not None else None
+            if run.pyramid is not None:
+                self.report.count('pyramids_stored')
                 continue
-            metadata = metadata_expr(all_info)
-            stats = stats_expr(all_info)
+            run.pyramid = pyramid.build(run.all_data)
+            run.release()
+            if store is not None:
+                store.put(path, run.pyramid)
 
-            data = informed_extract_to_df(data_exprs, all_info, timeline)
+    # Turn a single file into the data, flattened metadata and stats of a Run
+    # or None if it was discarded. With lazy, the data is None. This runs in
+    # worker processes so it must only depend on picklable state.
+    # When profiling, a Report of the file's phases is returned with it.
+    def load(self, data_exprs, metadata_expr, stats_expr, timeline, interval,
+             lazy, exprs, path):
+        if not self.report.enabled:
+            return self.load_file(data_exprs, metadata_expr, stats_expr,
+                                  timeline, interval, lazy, exprs, path)
+        self.timer = Report()
+        try:
+            result = self.load_file(data_exprs, metadata_expr, stats_expr,
+                                    timeline, interval, lazy, exprs, path)
+            return result, self.timer
+        finally:
+            self.timer = NULL
 
-            runs.append(Run(i + 1, data, RunMetadata(flatten(metadata)), stats,
-                            os.path.join(self.root, datafile)))
-        normalize(runs)
-        return runs
+    def load_file(self, data_exprs, metadata_expr, stats_expr, timeline,
+                  interval, lazy, exprs, path):
+        if self.cache is None:
+            return self.parse(data_exprs, metadata_expr, stats_expr, timeline,
+                              interval, lazy, path)
+
+        # Lazily loaded files only need their metadata and stats, so their
+        # data is neither read from the cache nor stored until it is used
+        # (see LazyData)
+        key = self.cache.key(path, exprs)
+        with self.timer.phase('cache'):
+            result = self.cache.get(key, data=not lazy)
+        if result is not MISS:
+            self.timer.count('files_cached')
+            return result
+        result = self.parse(data_exprs, metadata_expr, stats_expr, timeline,
+                            interval, lazy, path)
+        self.cache.put(key, path, result)
+        return result
+
+    def parse(self, data_exprs, metadata_expr, stats_expr, timeline, interval,
+              lazy, path):
+        timer = self.timer
+        timer.count('files')
+        metadata = None
+        header = None
+        # Whether the discards were run, on the header or the whole file
+        discarded = None
+        header_only = lazy and stats_expr is None
+        if self.discards or self.filters or header_only:
+            with timer.phase('extract_metadata'):
+                header = extract_metadata(path)
+        if header is not None:
+            try:
+                with timer.phase('discard'):
+                    discarded = self.do_discard(header)
+            except KeyError:
+                # A discard which needs more than "metadata" is run on the
+                # whole file instead, as with metadata_expr
+                pass
+            if discarded:
+                timer.count('files_discarded')
+                return None
+            try:
+                with timer.phase('flatten'):
+                    metadata = flatten(metadata_expr(header), arrays=self.arrays)
+            except KeyError:
+                pass
+            if metadata is not None and self.do_filter(metadata):
+                timer.count('files_discarded')
+                return None
+            if metadata is not None and header_only and discarded is not None:
+                return None, metadata, None
+
+        with timer.phase('extract'):
+            all_info = extract(path)
+        if timer.enabled:
+            timer.count('bytes', os.path.getsize(path))
+        if discarded is None:
+            with timer.phase('discard'):
+                discarded = self.do_discard(all_info)
+            if discarded:
+                timer.count('files_discarded')
+                return None
+        if metadata is None:
+            with timer.phase('flatten'):
+                metadata = flatten(metadata_expr(all_info), arrays=self.arrays)
+            if self.do_filter(metadata):
+                timer.count('files_discarded')
+                return None
+        stats = None
+        if stats_expr is not None:
+            with timer.phase('stats'):
+                stats = stats_expr(all_info)
+        if lazy:
+            return None, metadata, stats
+        with timer.phase('informed_extract_to_df'):
+            data = informed_extract_to_df(data_exprs, all_info, timeline,
+                                          interval)
+        timer.count('rows', len(data))
+        timer.count('columns', len(data.columns))
+        return data, metadata, stats
+
+
+class LazyData:
+    """
+    The data source of Runs loaded with lazy=True. A Run's DataFrame is built
+    from its result file, or read from the Loader's cache, the first time its
+    all_data is used, and then stored in the cache. The most recently used
+    max_frames DataFrames are kept so that using them again is free; older
+    ones are dropped and rebuilt if needed again. Run.release() drops one
+    early.
+    """
+    def __init__(self, loader, data_exprs, timeline, interval, exprs,
+                 max_frames=MAX_FRAMES, compact=False):
+        self.loader = loader
+        self.data_exprs = data_exprs
+        self.timeline = timeline
+        self.interval = interval
+        self.exprs = exprs
+        self.max_frames = max_frames
+        self.compact = compact
+        self.frames = collections.OrderedDict()
+
+    def get(self, run):
+        if run.id in self.frames:
+            self.frames.move_to_end(run.id)
+            return self.frames[run.id]
+
+        data = MISS
+        cache = self.loader.cache
+        if cache is not None:
+            key = cache.key(run.filename, self.exprs)
+            data = cache.data(key)
+        if data is MISS:
+            with self.loader.report.phase('lazy_load'):
+                data = informed_extract_to_df(self.data_exprs,
+                                              extract(run.filename),
+                                              self.timeline, self.interval)
+            # Complete the file's entry, stored without data when it was
+            # loaded
+            if cache is not None:
+                result = cache.get(key, data=False)
+                if result is not MISS and result is not None:
+                    cache.put(key, run.filename, (data, *result[1:]))
+        if self.compact:
+            data = downcast(data)
 
+        self.frames[run.id] = data
+        if self.max_frames is not None:
+            while len(self.frames) > self.max_frames:
+                self.frames.popitem(last=False)
+        return data
 
-def informed_extract_to_df(exprs, text, timeline):
-    df_final = pd.DataFrame()
+    def release(self, run):
+        self.frames.pop(run.id, None)
 
+
+# Build a single DataFrame of every source of data in text indexed by the time
+# relative to the first sample. All sources are aligned on the sorted union of
+# their timestamps in one pass (see align()) rather than merged one at a time.
+# With an interval, the samples are averaged into buckets of that width (e.g.
+# '1s') so that the sources share a common timeline (see resample()).
+def informed_extract_to_df(exprs, text, timeline, interval=None):
+    frames = []
     for name, data_expr in exprs.items():
         data = data_expr(text)
         if not data:
@@ -65,9 +391,22 @@ def informed_extract_to_df(exprs, text, timeline):
         df = pd.DataFrame(data)
         df[timeline] = pd.to_datetime(df[timeline], utc=True)
         df = df.set_index(timeline)
-        df = df.add_prefix(name + '_')
+        frames.append(df.add_prefix(name + '_'))
+
+    if not frames:
+        df_final = pd.DataFrame()
+    elif all(df.index.is_unique for df in frames):
+        df_final = align(frames)
+    else:
+        # Repeated timestamps can't be aligned on a union of timestamps.
+        # Merging pairs up rows with the same timestamp instead.
+        df_final = ft.reduce(
+            lambda left, right: pd.merge(left, right, how='outer',
+                                         left_index=True, right_index=True),
+            frames).sort_index(kind='stable')
 
-        df_final = pd.merge(df_final, df, how='outer', left_index=True, right_index=True)
+    if interval is not None and len(df_final):
+        df_final = resample(df_final, interval)
 
     zero = df_final.index.min()
     df_final['relative_time'] = df_final.index - zero
@@ -75,35 +414,213 @@ def informed_extract_to_df(exprs, text, timeline):
 
     return df_final
 
+# Average the samples of df into buckets of interval from its first sample.
+# Columns which can't be averaged, such as strings, take the last value in
+# each bucket instead.
+def resample(df, interval):
+    means = df.resample(interval, origin='start').mean(numeric_only=True)
+    others = df.columns.difference(means.columns, sort=False)
+    if not len(others):
+        return means
+    lasts = df[others].resample(interval, origin='start').last()
+    return pd.concat([means, lasts], axis=1)[df.columns]
+
+# Outer join DataFrames with unique DatetimeIndexes. Each column is gathered
+# once into the sorted union of all timestamps, filling gaps with NaN, which
+# gives the same result as successive outer merges without copying the
+# growing result for every source.
+def align(frames):
+    units = ['s', 'ms', 'us', 'ns']
+    unit = max((df.index.unit for df in frames), key=units.index)
+    stamps = [df.index.as_unit(unit).asi8 for df in frames]
+
+    union = np.sort(np.concatenate(stamps))
+    union = union[np.concatenate(([True], union[1:] != union[:-1]))]
+
+    columns = {}
+    for df, df_stamps in zip(frames, stamps):
+        if len(df_stamps) == len(union):
+            indexer = np.argsort(df_stamps, kind='stable')
+        else:
+            indexer = np.full(len(union), -1, dtype=np.intp)
+            indexer[np.searchsorted(union, df_stamps)] = np.arange(len(df_stamps))
+        for col in df.columns:
+            columns[col] = take(df[col].array, indexer, allow_fill=True)
+
+    index = pd.DatetimeIndex(union.view(f'M8[{unit}]'),
+                             dtype=frames[0].index.as_unit(unit).dtype,
+                             name=frames[0].index.name)
+    return pd.DataFrame(columns, index=index, copy=False)
+
+
+# Return df with float64 and int64 columns narrowed to float32 and int32 where
+# no value changes. Columns of numeric strings are first converted to numbers.
+def downcast(df):
+    columns = {}
+    for col in df.columns:
+        series = df[col]
+        if series.dtype == object or pd.api.types.is_string_dtype(series):
+            try:
+                series = pd.to_numeric(series)
+            except (ValueError, TypeError):
+                pass
+        if series.dtype == np.float64:
+            narrow = series.astype(np.float32)
+            if ((narrow.astype(np.float64) == series) | series.isna()).all():
+                series = narrow
+        elif series.dtype == np.int64:
+            info = np.iinfo(np.int32)
+            if len(series) == 0 or (series.min() >= info.min and series.max() <= info.max):
+                series = series.astype(np.int32)
+        columns[col] = series
+    return pd.DataFrame(columns, index=df.index)
+
 
 # inspo from
 # https://stackoverflow.com/questions/6027558/flatten-nested-dictionaries-compressing-keys
 
-# TODO: handle arrays
-def flatten(dictionary, parent_key=''):
+# Composite keys made so far by (parent key, key). Every Run flattened in a
+# process then shares one string per distinct key rather than building and
+# keeping its own copies.
+composite_keys = {}
+
+def composite_key(parent_key, k):
+    key = composite_keys.get((parent_key, k))
+    if key is None:
+        key = sys.intern(parent_key + '_' + str(k) if parent_key else str(k))
+        composite_keys[(parent_key, k)] = key
+    return key
+
+# Nested maps are walked depth first with a stack of iterators, writing
+# straight into one result dict. arrays says what to do with lists:
+#   None: keep them as values, as they are
+#   'index': flatten them like maps keyed by position, e.g. disks_0_size
+#   'tuple': turn them into tuples (with maps in them flattened to tuples of
+#            items) so that the value is hashable
+def flatten(dictionary, parent_key='', arrays=None):
+    if arrays not in ARRAYS:
+        raise ValueError(f'Unknown arrays {arrays!r}')
     result = {}
-    for k, v in dictionary.items():
-        new_key = parent_key + '_' + k if parent_key else k
-        if isinstance(v, MutableMapping):
-            result.update(flatten(v, parent_key=new_key))
+    stack = [(parent_key, iter(dictionary.items()))]
+    while stack:
+        prefix, items = stack[-1]
+        for k, v in items:
+            key = composite_key(prefix, k)
+            if type(v) is dict or isinstance(v, MutableMapping):
+                stack.append((key, iter(v.items())))
+                break
+            if type(v) is list and arrays is not None:
+                if arrays == 'index':
+                    stack.append((key, enumerate(v)))
+                    break
+                v = to_tuple(v)
+            result[key] = v
         else:
-            result[new_key] = v
+            stack.pop()
     return result
 
+def to_tuple(value):
+    if isinstance(value, list):
+        return tuple(to_tuple(item) for item in value)
+    if isinstance(value, MutableMapping):
+        return tuple(flatten(value, arrays='tuple').items())
+    return value
+
 def extract(file):
     output = {}
     with open(file) as f:
         output = json.load(f)
     return output
 
+# Parse only the top-level "metadata" object of file into a dict with just
+# that key. The parser stops as soon as it has been read, so files which put
+# metadata before data are barely read at all. Returns None if no streaming
+# parser is available.
+def extract_metadata(file):
+    if ijson is None:
+        return None
+    with open(file, 'rb') as f:
+        for metadata in ijson.items(f, 'metadata', use_float=True):
+            return {'metadata': metadata}
+    return {}
+
+# Give every Run the same keys: the union of all of their keys, kept once in
+# a Schema shared by all of them. Each Run keeps only its own values, and
+# reading a key it doesn't have gives MISSING.
 def normalize(runs):
-    all_attrs = set()
+    schema = Schema()
     for run in runs:
-        all_attrs.update(run.metadata.keys())
+        schema.extend(run.metadata.keys())
+
+    for run in runs:
+        run.metadata = RunMetadata(SchemaRow(schema, own_values(run.metadata)))
+    return schema
+
+# Normalize new_runs against runs which were already normalized. When runs
+# share a Schema, keys new_runs bring are added to it and no existing Run is
+# touched.
+def widen(runs, new_runs):
+    schema = shared_schema(runs)
+    if schema is None:
+        normalize(runs + new_runs)
+        return
 
-    base_metadata = {
-        attr: '' for attr in all_attrs
-    }
+    for run in new_runs:
+        schema.extend(run.metadata.keys())
+    for run in new_runs:
+        run.metadata = RunMetadata(SchemaRow(schema, own_values(run.metadata)))
 
+# The Schema the metadata of all runs is over, if they share one
+def shared_schema(runs):
+    schemas = {id(mapping.schema): mapping.schema for mapping in
+               (unwrap(run.metadata) for run in runs)
+               if isinstance(mapping, SchemaRow)}
+    if len(schemas) != 1 or len(runs) == 0:
+        return None
+    schema = next(iter(schemas.values()))
+    if not all(isinstance(unwrap(run.metadata), SchemaRow) for run in runs):
+        return None
+    return schema
+
+# The values a Run's metadata actually has, without MISSING ones
+def own_values(metadata):
+    metadata = unwrap(metadata)
+    if isinstance(metadata, SchemaRow):
+        return metadata.values
+    # Freshly flattened metadata usually has none and is used as it is
+    if isinstance(metadata, dict) and not any(
+            v is MISSING for v in metadata.values()):
+        return metadata
+    return {k: v for k, v in metadata.items() if v is not MISSING}
+
+
+# Replace the metadata of normalized runs with rows of one shared
+# MetadataTable
+def compact_metadata(runs):
+    table = MetadataTable([run.metadata for run in runs])
+    for i, run in enumerate(runs):
+        run.metadata = RunMetadata(table.row(i))
+    return table
+
+# Estimated bytes used by the data and metadata of runs
+def memory_usage(runs):
+    # Data which is loaded lazily isn't counted
+    data = sum(int(run.all_data.memory_usage(deep=True).sum()) for run in runs
+               if run.data_source is None)
+    metadata = 0
+    tables = set()
     for run in runs:
-        run.metadata = RunMetadata({**base_metadata, **run.metadata})
+        mapping = run.metadata.metadata
+        metadata += sys.getsizeof(run.metadata) + sys.getsizeof(mapping)
+        if isinstance(mapping, MetadataRow):
+            if id(mapping.table) not in tables:
+                tables.add(id(mapping.table))
+                metadata += mapping.table.nbytes()
+        elif isinstance(mapping, SchemaRow):
+            metadata += sizeof(mapping.values)
+            if id(mapping.schema) not in tables:
+                tables.add(id(mapping.schema))
+                metadata += sizeof(mapping.schema.index)
+        else:
+            metadata += sizeof(mapping)
+    return pd.Series({'data': data, 'metadata': metadata})
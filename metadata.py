@@ -1,8 +1,129 @@
 from collections.abc import Mapping
+import itertools
+import operator
+import sys
+import numpy as np
+import pandas as pd
+
+class Missing:
+    """
+    The value of an attribute which a Run's metadata doesn't have once
+    normalize() has given every Run the same keys. There is only one, MISSING,
+    and it is only equal to itself. It prints as an empty string.
+    """
+    __slots__ = ()
+
+    def __repr__(self):
+        return 'MISSING'
+
+    def __str__(self):
+        return ''
+
+    def __bool__(self):
+        return False
+
+    # Hashed by identity, like any object without __eq__, which keeps the
+    # hashing of MISSING done when factorizing metadata in C
+
+    # Unpickled as the same MISSING
+    def __reduce__(self):
+        return 'MISSING'
+
+
+MISSING = Missing()
+
+
+class Schema:
+    """
+    The ordered keys which the metadata of every Run has after normalize(),
+    shared by all of them. Adding keys to it adds them to every Run, as
+    MISSING, without touching any Run.
+    """
+    def __init__(self, keys=()):
+        self.keys = []
+        self.index = {}
+        self.extend(keys)
+
+    def extend(self, keys):
+        for key in keys:
+            if key not in self.index:
+                self.index[key] = len(self.keys)
+                self.keys.append(key)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __iter__(self):
+        return iter(self.keys)
+
+
+class SchemaRow(Mapping):
+    """
+    The metadata of a single Run over a shared Schema. Only the values the Run
+    actually has are stored; every other key of the schema maps to MISSING.
+    """
+    __slots__ = ('schema', 'values')
+
+    def __init__(self, schema, values):
+        self.schema = schema
+        self.values = values
+
+    def __getitem__(self, key):
+        value = self.values.get(key, MISSING)
+        if value is MISSING and key not in self.schema.index:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        if key in self.schema.index:
+            return self.values.get(key, MISSING)
+        return default
+
+    def __iter__(self):
+        return iter(self.schema.keys)
+
+    def __len__(self):
+        return len(self.schema.keys)
+
+    def __contains__(self, key):
+        return key in self.schema.index
+
+    # The values of keys, in order
+    def take(self, keys):
+        return tuple(map(self.values.get, keys, itertools.repeat(MISSING)))
+
+    def __eq__(self, other):
+        if isinstance(other, SchemaRow) and other.schema is self.schema:
+            return self.values == other.values
+        return super().__eq__(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(dict(self))
+
 
 class RunMetadata(Mapping):
+    """
+    The flattened metadata of a Run or RunGroup. It can't be changed once made
+    (nor may the Mapping it wraps be), so its hash is computed only once.
+    """
+    __slots__ = ('metadata', 'hash')
+
+    # metadata may be a dict or any other Mapping, such as a row of a
+    # MetadataTable
     def __init__(self, metadata):
-        self.metadata = metadata
+        object.__setattr__(self, 'metadata', metadata)
+        object.__setattr__(self, 'hash', None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('RunMetadata is immutable')
+
+    def __reduce__(self):
+        return RunMetadata, (self.metadata,)
 
     def __getitem__(self, key):
         return self.metadata[key]
@@ -14,10 +135,33 @@ class RunMetadata(Mapping):
         return len(self.metadata)
 
     def __eq__(self, other):
-        return self.metadata == other.metadata
+        if self is other:
+            return True
+        if isinstance(other, RunMetadata):
+            if self.metadata is other.metadata:
+                return True
+            if self.hash is not None and other.hash is not None and \
+                    self.hash != other.hash:
+                return False
+            return self.metadata == other.metadata
+        if isinstance(other, Mapping):
+            return self.metadata == other
+        return NotImplemented
 
+    # MISSING values are left out so that only the values a Run actually has
+    # are hashed. Equal metadata still hashes the same.
     def __hash__(self):
-        return hash(frozenset(self.metadata.items()))
+        if self.hash is None:
+            metadata = self.metadata
+            items = metadata.values.items() if isinstance(metadata, SchemaRow) \
+                else metadata.items()
+            items = [item for item in items if item[1] is not MISSING]
+            try:
+                result = hash(frozenset(items))
+            except TypeError:
+                result = hash(frozenset((k, canonical(v)) for k, v in items))
+            object.__setattr__(self, 'hash', result)
+        return self.hash
 
     def __repr__(self):
         return repr(self.metadata)
@@ -34,7 +178,7 @@ class RunMetadata(Mapping):
     # Given other, a RunMetadata, return a RunMetadata which includes all of
     # the contents of both with no duplicates
     def union(self, other):
-        return RunMetadata(self.metadata | other.metadata)
+        return RunMetadata({**self.metadata, **other.metadata})
 
     # Return a RunMetadata containing only the metadata in self that was not
     # exactly the same in other
@@ -47,7 +191,147 @@ class RunMetadata(Mapping):
         return RunMetadata(result)
 
     def subset(self, chosen_keys):
+        metadata = unwrap(self.metadata)
+        if isinstance(metadata, SchemaRow):
+            values = metadata.values
+            return RunMetadata({k: values.get(k, MISSING) for k in
+                                metadata.schema.keys if k in chosen_keys})
         return RunMetadata({ k: v for k, v in self.metadata.items() if k in chosen_keys})
 
     def pretty_print(self):
         return ''.join([f' {k}: {v}' for k, v in self.metadata.items()]) + '\n'
+
+
+class MetadataTable:
+    """
+    The metadata of many Runs stored as one table of Runs by attributes. Every
+    attribute is a categorical column: each distinct value is stored once and
+    Runs only hold small integer codes for their values. The Runs must have
+    been normalized so that they all have the same keys.
+    """
+    def __init__(self, metadatas):
+        self.keys = list(metadatas[0].keys()) if metadatas else []
+        self.columns = {key: i for i, key in enumerate(self.keys)}
+        self.categories = []
+
+        # Take the values of all keys from each Run at once and then transpose
+        # them into columns
+        getter = operator.itemgetter(*self.keys) if self.keys else None
+        rows = []
+        for metadata in metadatas if getter else ():
+            metadata = unwrap(metadata)
+            if isinstance(metadata, SchemaRow):
+                rows.append(metadata.take(self.keys))
+            elif len(self.keys) == 1:
+                rows.append((getter(metadata),))
+            else:
+                rows.append(getter(metadata))
+
+        codes = []
+        for column in zip(*rows):
+            column_codes, uniques = factorize(column)
+            codes.append(column_codes)
+            self.categories.append(uniques)
+
+        most = max((len(categories) for categories in self.categories), default=0)
+        self.codes = np.empty((len(metadatas), len(self.keys)),
+                              dtype=np.min_scalar_type(most))
+        for j, column_codes in enumerate(codes):
+            self.codes[:, j] = column_codes
+
+    def __len__(self):
+        return len(self.codes)
+
+    def row(self, i):
+        return MetadataRow(self, i)
+
+    # The table as a DataFrame of categoricals with one row per Run
+    def frame(self):
+        return pd.DataFrame({
+            key: pd.Series(self.categories[j], dtype=object)
+                   .take(self.codes[:, j]).astype('category').array
+            for j, key in enumerate(self.keys)
+        })
+
+    def nbytes(self):
+        return self.codes.nbytes + sum(sizeof(value) for categories in
+                                       self.categories for value in categories)
+
+
+class MetadataRow(Mapping):
+    """
+    The metadata of a single Run in a MetadataTable. Keys and values are
+    looked up in the table rather than copied.
+    """
+    __slots__ = ('table', 'row')
+
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+
+    def __getitem__(self, key):
+        j = self.table.columns[key]
+        return self.table.categories[j][self.table.codes[self.row, j]]
+
+    def __iter__(self):
+        return iter(self.table.keys)
+
+    def __len__(self):
+        return len(self.table.keys)
+
+    def __contains__(self, key):
+        return key in self.table.columns
+
+    def __eq__(self, other):
+        if isinstance(other, MetadataRow) and other.table is self.table:
+            return np.array_equal(self.table.codes[self.row],
+                                  self.table.codes[other.row])
+        return super().__eq__(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+# A hashable stand-in for a metadata value: lists become tuples, sets
+# frozensets and maps tuples of their items. Other values are returned as is.
+def canonical(value):
+    if isinstance(value, list):
+        return tuple(canonical(item) for item in value)
+    if isinstance(value, dict):
+        return tuple((k, canonical(v)) for k, v in value.items())
+    if isinstance(value, set):
+        return frozenset(canonical(item) for item in value)
+    return value
+
+
+# The codes of values, numbered by first appearance, and the distinct values.
+# Unhashable values are factorized by their canonical() stand-ins but the
+# first original value of each is kept, so dicts and lists come back as such.
+def factorize(values):
+    array = np.fromiter(values, dtype=object, count=len(values))
+    try:
+        codes, uniques = pd.factorize(array, use_na_sentinel=False)
+        return codes, uniques.tolist()
+    except TypeError:
+        array = np.fromiter(map(canonical, values), dtype=object,
+                            count=len(values))
+        codes, _ = pd.factorize(array, use_na_sentinel=False)
+        _, firsts = np.unique(codes, return_index=True)
+        return codes, [values[i] for i in firsts.tolist()]
+
+
+# The innermost Mapping of a possibly nested RunMetadata
+def unwrap(metadata):
+    while isinstance(metadata, RunMetadata):
+        metadata = metadata.metadata
+    return metadata
+
+
+# An estimate of the memory used by a metadata value or a dict of them
+def sizeof(value):
+    if isinstance(value, Mapping):
+        return sys.getsizeof(value) + sum(sizeof(k) + sizeof(v)
+                                          for k, v in value.items())
+    return sys.getsizeof(value)
@@ -0,0 +1,246 @@
+import hashlib
+import os
+import numpy as np
+import pandas as pd
+
+# Multi-resolution summaries of the data of a Run. Level 0 splits the Run's
+# timeline into buckets of a base interval (by default its sampling interval)
+# and every level above halves the number of buckets, so level k has buckets
+# of base * 2 ** k. Each bucket holds the min, max, sum and count of every
+# numeric column. Drawing a Run at any zoom then only needs about as many
+# buckets as there are pixels, from the coarsest level which still has one
+# per pixel, and the sum or extremes of any window take a few buckets per
+# level.
+
+STATS = ('min', 'max', 'sum', 'count')
+
+# Aggregations which reduce() can answer from the buckets of a pyramid
+REDUCIBLE = {'min', 'max', 'sum', 'count', 'mean'}
+
+
+class Pyramid:
+    """
+    The levels of summaries of the columns of one Run. The stats of each
+    column are kept as one array per statistic holding every level in turn,
+    sizes[k] buckets for level k. Buckets without samples have a count of 0
+    and NaN min and max. base is the width of a level 0 bucket.
+    A Pyramid loaded by a PyramidStore reads the arrays of each column from
+    its file only when the column is first used.
+    """
+    def __init__(self, columns, base, sizes, data=None, path=None):
+        self.columns = columns
+        self.base = base
+        self.sizes = sizes
+        self.offsets = np.concatenate(([0], np.cumsum(sizes))).astype(np.intp)
+        self.positions = {column: j for j, column in enumerate(columns)}
+        self.data = {} if data is None else data
+        self.path = path
+
+    def __repr__(self):
+        return (f'Pyramid({len(self.columns)} columns, {len(self.sizes)} '
+                f'levels, base {self.base})')
+
+    def __len__(self):
+        return len(self.sizes)
+
+    # The width of a bucket of level
+    def width(self, level):
+        return self.base * 2 ** level
+
+    # The timeline covered, the end of the last bucket
+    def extent(self):
+        return self.width(0) * self.sizes[0] if self.sizes else pd.Timedelta(0)
+
+    def column(self, column):
+        if column not in self.data:
+            j = self.positions[column]
+            with np.load(self.path) as f:
+                self.data[column] = {name: f[f'{name}_{j}'] for name in STATS}
+        return self.data[column]
+
+    # The stats of column at level as a dict of arrays of its buckets
+    def stats(self, column, level):
+        start, end = self.offsets[level], self.offsets[level + 1]
+        return {name: values[start:end]
+                for name, values in self.column(column).items()}
+
+    # The coarsest level with at least points buckets between start and end,
+    # Timedeltas or None for the ends of the timeline
+    def level_for(self, points, start=None, end=None):
+        start = pd.Timedelta(0) if start is None else start
+        end = self.extent() if end is None else end
+        level = 0
+        while level + 1 < len(self) and \
+                (end - start) / self.width(level + 1) >= points:
+            level += 1
+        return level
+
+    # The stats of column at level for the buckets from start to end as a
+    # DataFrame indexed by the start time of each bucket, with the mean too
+    def window(self, column, level, start=None, end=None):
+        width = self.width(level)
+        size = self.sizes[level]
+        first = 0 if start is None else min(max(int(start // width), 0), size)
+        last = size if end is None else min(max(int(-(-end // width)), first), size)
+        stats = self.stats(column, level)
+        frame = pd.DataFrame({name: stats[name][first:last] for name in STATS},
+                             index=pd.TimedeltaIndex(
+                                 (np.arange(first, last) * width.value).view('m8[ns]'),
+                                 name='relative_time'))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            frame['mean'] = frame['sum'] / frame['count']
+        return frame
+
+    def reduce(self, column, how, start=None, end=None):
+        """
+        Aggregate column with how (one of REDUCIBLE) over the level 0 buckets
+        which start from start to end inclusive, using at most two buckets of
+        each level. This is exact when every sample falls at the start of its
+        bucket and otherwise off by at most a bucket's samples at either end.
+        """
+        if how not in REDUCIBLE:
+            raise ValueError(f'Unknown aggregation {how!r}')
+        size = self.sizes[0] if self.sizes else 0
+        first = 0 if start is None else max(-(-start // self.base), 0)
+        last = size if end is None else min(end // self.base + 1, size)
+        buckets = {name: [] for name in STATS}
+        level = 0
+        while first < last:
+            stats = self.stats(column, level)
+            if first % 2:
+                for name in STATS:
+                    buckets[name].append(stats[name][first])
+                first += 1
+            if last % 2 and first < last:
+                for name in STATS:
+                    buckets[name].append(stats[name][last - 1])
+                last -= 1
+            first, last, level = first // 2, last // 2, level + 1
+
+        count = int(np.sum(buckets['count']))
+        if how == 'count':
+            return count
+        if how == 'sum':
+            return float(np.sum(buckets['sum']))
+        if not count:
+            return np.nan
+        if how == 'mean':
+            return float(np.sum(buckets['sum'])) / count
+        if how == 'min':
+            return float(np.nanmin(buckets['min']))
+        return float(np.nanmax(buckets['max']))
+
+    def nbytes(self):
+        return sum(values.nbytes for stats in self.data.values()
+                   for values in stats.values())
+
+
+# The median time between samples of df with distinct times, or a second if
+# there are fewer than two. Steps between samples sharing a time don't count,
+# or the interval could be zero and the number of buckets explode.
+def sampling_interval(df):
+    steps = np.diff(df.index.as_unit('ns').asi8)
+    steps = steps[steps > 0]
+    if not len(steps):
+        return pd.Timedelta(seconds=1)
+    return pd.Timedelta(int(np.median(steps)), 'ns')
+
+
+def build(df, base=None, columns=None):
+    """
+    Build the Pyramid of the numeric columns (or just columns) of df, a Run's
+    data indexed by relative time. Level 0 is computed from the samples with
+    one reduceat() per statistic over the sorted buckets and every level above
+    from pairs of buckets of the one below, so the whole pyramid costs about
+    two passes over the data.
+    """
+    df = df.select_dtypes('number') if columns is None else df[columns]
+    base = sampling_interval(df) if base is None else pd.Timedelta(base)
+    columns = list(df.columns)
+    if not len(df):
+        return Pyramid(columns, base, [],
+                       {column: {name: np.empty(0) for name in STATS}
+                        for column in columns})
+
+    times = df.index.as_unit('ns').asi8
+    order = np.argsort(times, kind='stable')
+    bins = times[order] // base.value
+    values = df.to_numpy(dtype=float)[order]
+    present = ~np.isnan(values)
+
+    starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+    nbins = int(bins[-1]) + 1
+    occupied = bins[starts]
+
+    level = {
+        'min': np.full((nbins, len(columns)), np.nan),
+        'max': np.full((nbins, len(columns)), np.nan),
+        'sum': np.zeros((nbins, len(columns))),
+        'count': np.zeros((nbins, len(columns)), dtype=np.int32),
+    }
+    level['min'][occupied] = np.fmin.reduceat(values, starts, axis=0)
+    level['max'][occupied] = np.fmax.reduceat(values, starts, axis=0)
+    level['sum'][occupied] = np.add.reduceat(np.where(present, values, 0), starts, axis=0)
+    level['count'][occupied] = np.add.reduceat(present, starts, axis=0)
+
+    levels = [level]
+    while len(level['count']) > 1:
+        level = {name: coarsen(name, stats) for name, stats in level.items()}
+        levels.append(level)
+
+    data = {column: {name: np.concatenate([level[name][:, j] for level in levels])
+                     for name in STATS}
+            for j, column in enumerate(columns)}
+    return Pyramid(columns, base, [len(level['count']) for level in levels], data)
+
+
+# Merge each pair of buckets of a level into one of the next
+def coarsen(name, stats):
+    if len(stats) % 2:
+        pad = np.nan if name in ('min', 'max') else 0
+        stats = np.vstack([stats, np.full((1, stats.shape[1]), pad, dtype=stats.dtype)])
+    if name == 'min':
+        return np.fmin(stats[0::2], stats[1::2])
+    if name == 'max':
+        return np.fmax(stats[0::2], stats[1::2])
+    return stats[0::2] + stats[1::2]
+
+
+class PyramidStore:
+    """
+    Pyramids saved to a directory, one .npz file per result file, so that
+    they are built only once. Like a RunCache, each is keyed by the path,
+    mtime and size of the result file and a fingerprint of the expressions
+    which extract its data. Each column's stats are separate arrays of the
+    file, so reading a Pyramid only reads the columns used.
+    """
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, path, fingerprint):
+        st = os.stat(path)
+        raw = f'{os.path.abspath(path)}\0{st.st_mtime_ns}\0{st.st_size}\0{fingerprint}'
+        return os.path.join(self.root, hashlib.sha1(raw.encode()).hexdigest() + '.npz')
+
+    # The Pyramid stored at path (see path()), or None
+    def get(self, path):
+        try:
+            with np.load(path) as f:
+                columns = f['columns'].tolist()
+                base = pd.Timedelta(int(f['base']), 'ns')
+                sizes = f['sizes'].tolist()
+        except (OSError, ValueError, KeyError):
+            return None
+        return Pyramid(columns, base, sizes, path=path)
+
+    def put(self, path, pyramid):
+        arrays = {f'{name}_{j}': values
+                  for j, column in enumerate(pyramid.columns)
+                  for name, values in pyramid.column(column).items()}
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, columns=np.array(pyramid.columns, dtype=str),
+                     base=np.int64(pyramid.base.value),
+                     sizes=np.array(pyramid.sizes, dtype=np.int64), **arrays)
+        os.replace(tmp, path)
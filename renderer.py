@@ -1,15 +1,32 @@
 #!/usr/local/bin/python3
 
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from datetime import timedelta
+import html
+import os
+import pickle
 import pandas as pd
 import matplotlib as mp
 import matplotlib.pyplot as plt
 from textwrap import wrap
 from benchart import Run, RunGroup
+import decimate
+from metadata import RunMetadata
+from grid import align_group
+import pyramid
+from replicates import BANDS, aggregate_group
+from stats import to_timedelta
+from store import shared_store
+from timing import NULL, as_report
+from tree import do_relabel_tree, render_print_tree
 import collections
 
 DEBUG = False
 
+# How PlotRenderer can reduce the points of long lines: not at all (None),
+# with decimate.minmax() or decimate.lttb(), or from the Run's pyramid
+DOWNSAMPLES = {None, 'minmax', 'lttb', 'pyramid'}
+
 
 class Renderer:
     def __init__(self, occludes=set(), relabels={}):
@@ -17,6 +34,8 @@ class Renderer:
         # labels and titles.
         self.relabels = relabels
         self.occludes = occludes
+        # Where the time spent drawing is recorded, see timing.py
+        self.report = NULL
 
 
 class SubfigureRenderer(Renderer):
@@ -63,24 +82,55 @@ class PlotRenderer(Renderer):
     Renders Runs as plots in Matplotlib. A Pandas DataFrame is created for
     every Run's data of the passed in Run or Run children of the passed-in
     RunGroup on the passed-in axis.
+    With downsample set to 'minmax' or 'lttb' (see decimate.py), lines with
+    more points than the axes is wide in pixels are decimated before being
+    plotted. Decimated lines are kept on each Run (see Run.lines), so drawing
+    it again at the same size, e.g. after BenchArt.add(), reuses them.
+    timebounds are the start and end of the part of each Run plotted, as times
+    from its start: seconds, Timedeltas or strings like '5min' (see
+    stats.to_timedelta()), or None for either end of the timeline. They were
+    row positions before; see the README for converting old timebounds.
+    With downsample set to 'pyramid', lines are plotted from the Run's
+    pyramid (see pyramid.py) instead of its data, built from it if the loader
+    didn't.
+    With interval, the Runs of each RunGroup are plotted from their data
+    resampled onto a grid of that interval shared by the whole RunGroup (see
+    grid.py), aggregating samples with how.
+    With replicates, sibling Runs which would have the same label are plotted
+    as one line of their mean with a band of its confidence interval (band
+    'ci') or of their min and max (band 'minmax') instead (see replicates.py).
+    With raw, their own lines are plotted faintly as well.
     """
-    def __init__(self, *args, timebounds=(0, None), **kwargs):
+    def __init__(self, *args, timebounds=(0, None), downsample=None,
+                 interval=None, how='mean', replicates=False, raw=False,
+                 band='ci', confidence=0.95, **kwargs):
         super().__init__(*args, **kwargs)
+        if band not in BANDS:
+            raise ValueError(f'Unknown band {band!r}')
+        if downsample not in DOWNSAMPLES:
+            raise ValueError(f'Unknown downsample {downsample!r}')
         self.timebounds = timebounds
+        self.downsample = downsample
+        self.interval = interval
+        self.how = how
+        self.replicates = replicates
+        self.raw = raw
+        self.band = band
+        self.confidence = confidence
 
     def __call__(self, renderers, run_group: Run | RunGroup, ax, subject=None, set_title=False, indent=0):
         if isinstance(run_group, Run):
             run = run_group
-            df = run.all_data[self.timebounds[0]:self.timebounds[1]]
-            df = df.interpolate(method='linear')
-            if subject not in df.columns:
-                return
-            df.plot(y=subject, ax=ax, ylabel=subject, label=self.label(run))
-            # Display each tick on the X axis as MM:SS
-            ax.tick_params(axis='x', labelrotation=0)
-            ax.xaxis.set_major_formatter(lambda x, _: "%02d:%02d" % (x // 60, x % 60))
-            for label in ax.get_xticklabels():
-                label.set_horizontalalignment('center')
+            if self.replicates and run.rungroup is not None:
+                replicates, reduced = aggregate_group(
+                    run.rungroup, self.occludes, self.interval, self.confidence,
+                    self.how)[run.id]
+                if reduced is not None:
+                    # All replicates are drawn with the first of them
+                    if run is replicates[0]:
+                        self.plot_replicates(replicates, reduced, ax, subject)
+                    return
+            self.plot_run(run, ax, subject, label=self.label(run))
             return
 
         if isinstance(run_group.children[0], Run):
@@ -95,18 +145,135 @@ class PlotRenderer(Renderer):
                 continue
             self(None, run, ax, subject=run.all_data.columns[0], indent=indent + 2)
 
-    def label(self, run):
+    # With in_seconds, the line is plotted against seconds rather than its
+    # TimedeltaIndex, to share axes with lines plotted that way
+    def plot_run(self, run, ax, subject, in_seconds=False, **kwargs):
+        if self.downsample == 'pyramid' and self.interval is None:
+            return self.plot_pyramid(run, ax, subject, **kwargs)
+        if self.interval is not None and run.rungroup is not None:
+            aligned = align_group(run.rungroup, self.interval, self.how,
+                                  fill='linear')
+            if subject not in aligned.metrics:
+                return
+            df = self.bounded(aligned.run(run))
+        else:
+            df = self.bounded(run.all_data)
+        if subject not in df.columns:
+            return
+        with self.report.phase('line'):
+            line = self.line(run, df, subject, ax)
+        if self.interval is not None or in_seconds:
+            line = seconds(line)
+        with self.report.phase('plot'):
+            line.plot(ax=ax, ylabel=subject, **kwargs)
+        self.report.count('points', len(line))
+        self.format_axis(ax)
+
+    # The mean of each bucket of the coarsest level of the Run's pyramid with
+    # a bucket per pixel of timebounds, with their min and max as a band. How
+    # long the Run is doesn't matter, and only the pyramid is read.
+    def plot_pyramid(self, run, ax, subject, **kwargs):
+        if run.pyramid is None:
+            run.pyramid = pyramid.build(run.all_data)
+        p = run.pyramid
+        if subject not in p.positions or not len(p):
+            return
+        start, end = self.bounds()
+        with self.report.phase('line'):
+            level = p.level_for(max(int(ax.bbox.width), 1), start, end)
+            df = p.window(subject, level, start, end)
+            df = seconds(df[df['count'] > 0])
+        with self.report.phase('plot'):
+            df['mean'].plot(ax=ax, ylabel=subject, **kwargs)
+            ax.fill_between(df.index, df['min'], df['max'], alpha=0.2, linewidth=0,
+                            color=ax.get_lines()[-1].get_color())
+        self.report.count('points', len(df))
+        self.format_axis(ax)
+
+    # The mean of replicates with its band and, with raw, their own lines in
+    # the same color. All of them are plotted against seconds (see seconds()).
+    def plot_replicates(self, replicates, reduced, ax, subject):
+        if subject not in reduced.metrics:
+            return
+        with self.report.phase('aggregate'):
+            df = seconds(self.bounded(reduced.frame(subject)))
+        lower, upper = ('lower', 'upper') if self.band == 'ci' else ('min', 'max')
+        with self.report.phase('plot'):
+            df['mean'].plot(ax=ax, ylabel=subject,
+                            label=self.label(replicates[0], replicates))
+            color = ax.get_lines()[-1].get_color()
+            ax.fill_between(df.index, df[lower], df[upper], color=color,
+                            alpha=0.2, linewidth=0)
+        self.report.count('points', len(df))
+        self.report.count('replicates', len(replicates))
+        if self.raw:
+            for run in replicates:
+                self.plot_run(run, ax, subject, in_seconds=True,
+                              label='_nolegend_', color=color, alpha=0.3,
+                              linewidth=0.8)
+        self.format_axis(ax)
+
+    # timebounds as Timedeltas (or None for either end of the timeline)
+    def bounds(self):
+        return tuple(to_timedelta(bound) for bound in self.timebounds)
+
+    # The rows of df, indexed by time from the start of a Run, within
+    # timebounds
+    def bounded(self, df):
+        start, end = self.bounds()
+        return df.loc[start:end]
+
+    # Display each tick on the X axis as MM:SS
+    def format_axis(self, ax):
+        ax.tick_params(axis='x', labelrotation=0)
+        ax.xaxis.set_major_formatter(lambda x, _: "%02d:%02d" % (x // 60, x % 60))
+        for label in ax.get_xticklabels():
+            label.set_horizontalalignment('center')
+
+    # The interpolated subject column of df, decimated to fit ax
+    def line(self, run, df, subject, ax):
+        # Lines of data aligned with the rest of a RunGroup depend on its
+        # other Runs, so only those of the Run's own data are kept
+        width = max(int(ax.bbox.width), 1)
+        key = (self.downsample, subject, self.bounds(), width)
+        if self.downsample is not None and self.interval is None and \
+                key in run.lines:
+            self.report.count('lines_cached')
+            return run.lines[key]
+
+        series = df[subject]
+        # Aligned data was already interpolated for all Runs at once
+        if self.interval is None:
+            series = series.interpolate(method='linear')
+        if self.downsample is None:
+            return series
+
+        series = series.dropna()
+        x = (series.index / pd.Timedelta(seconds=1)).to_numpy(dtype=float)
+        y = series.to_numpy(dtype=float)
+        if self.downsample == 'minmax':
+            keep = decimate.minmax(x, y, width)
+        else:
+            keep = decimate.lttb(x, y, 2 * width)
+        series = series.iloc[keep]
+        if self.interval is None:
+            run.lines[key] = series
+        return series
+
+    # The label of run, or of its replicates if given
+    def label(self, run, replicates=None):
         prefix = f'Run {str(run.id)}'
-        show_attrs = run.metadata.keys() - run.rungroup.accumulated_attrs
+        if replicates:
+            ids = ', '.join(str(replicate.id) for replicate in replicates)
+            band = f'{self.confidence:.0%} CI' if self.band == 'ci' else 'min/max'
+            prefix = f'Runs {ids} (mean, {band}, n={len(replicates)})'
         # Attributes which will be occluded must be passed as ignores into
         # BenchArt.ignore() so that they are not used in grouping Runs into
         # RunGroups. Occludes are not included in the final label for Runs in a
         # chart.
-        if self.occludes:
-            show_attrs -= self.occludes
-        if not show_attrs:
+        subset = run.label_metadata(self.occludes)
+        if not subset:
             return prefix
-        subset = run.metadata.subset(show_attrs)
 
         return prefix + ': ' + do_relabel_str(subset, self.relabels)
 
@@ -120,8 +287,23 @@ class PlotRenderer(Renderer):
         return output
 
 
-def render(benchart, figure, timebounds, relabels):
-    root = benchart.run()
+# pandas plots evenly spaced Timedeltas as raw integers rather than the
+# seconds the axes are set up for, so data on a grid is plotted against seconds
+def seconds(data):
+    return data.set_axis(pd.Index(data.index / pd.Timedelta(seconds=1),
+                                  name=data.index.name))
+
+
+# Give a Report (see timing.py) as profile to record the time spent in each
+# renderer. With replicates, replicate Runs are plotted as one line with a
+# confidence band, and with raw also as their own lines. With downsample (one
+# of DOWNSAMPLES), long lines are plotted with about a point per pixel (see
+# PlotRenderer).
+def render(benchart, figure, timebounds, relabels, profile=None,
+           replicates=False, raw=False, downsample=None):
+    report = as_report(profile)
+    with report.phase('run'):
+        root = benchart.run()
 
     # The title often includes many shared attributes. This will be
     # displayed as collapsible JSON instead of using it as a title
@@ -131,10 +313,14 @@ def render(benchart, figure, timebounds, relabels):
         SubfigureRenderer(relabels),
         *benchart.renderers,
         AxesRenderer(relabels),
-        PlotRenderer(timebounds=timebounds, occludes=benchart.ignores, relabels=relabels),
+        PlotRenderer(timebounds=timebounds, occludes=benchart.ignores, relabels=relabels,
+                     replicates=replicates, raw=raw, downsample=downsample),
     ]
 
-    renderers[0](renderers[1:], root, figure, set_title=False)
+    for renderer in renderers:
+        renderer.report = report
+    with report.phase('render'):
+        renderers[0](renderers[1:], root, figure, set_title=False)
     return root, title
 
 def do_relabel_str(metadata, relabels):
@@ -146,38 +332,6 @@ def do_relabel_str(metadata, relabels):
         result += f'{key}: {v}, '
     return result
 
-def do_relabel_tree(metadata, relabels):
-    result = {}
-    for k, v in metadata.items():
-        key = k
-        if k in relabels.keys():
-            key = relabels[k]
-        result[key] = v
-    return result
-
-def render_print_tree(root, occludes=None, relabels=None, indent=0):
-    if isinstance(root, Run):
-        display = f"{str(root)}: "
-        show_attrs = root.metadata.keys() - root.rungroup.accumulated_attrs
-        if show_attrs:
-            if occludes:
-                show_attrs -= occludes
-            subset = root.metadata.subset(show_attrs)
-            attributes = str(subset)
-            if relabels:
-                attributes = str(do_relabel_tree(subset, relabels))
-            display += attributes
-        print(" " * indent + display)
-        return
-
-    if relabels:
-        root.metadata = do_relabel_tree(root.metadata, relabels)
-
-    print(" " * indent + str(root))
-
-    for node in root.children:
-        render_print_tree(node, occludes, relabels, indent + 2)
-
 
 # TODO: figure out how to do this title better -- maybe by changing how
 # accumulated_metadata works
@@ -185,20 +339,29 @@ def extra_title_expr(l):
     return ''
 
 class LeafParentRenderer(Renderer):
-    def __init__(self, root_metadata, *args, extra_title_expr=extra_title_expr, **kwargs):
+    def __init__(self, root_metadata, *args, extra_title_expr=extra_title_expr,
+                 only=None, **kwargs):
         super().__init__(*args, **kwargs)
         self.extra_title_expr = extra_title_expr
         self.root_metadata = root_metadata
+        # If given, only these leaf parent RunGroups are rendered
+        self.only = only
 
     def __call__(self, renderers, run_group, sorted_prefixes=[], title=''):
         if isinstance(run_group, Run):
             return
 
         if hasattr(run_group, 'children') and isinstance(run_group.children[0], Run):
+            if self.only is not None and not any(run_group is group for group in self.only):
+                return
             renderer, *renderers = renderers
-            cols = set()
-            for child in run_group.children:
-                cols.update(list(child.all_data.columns))
+            store = shared_store(run_group.children)
+            if store is not None:
+                cols = set(store.columns_of(run_group.children))
+            else:
+                cols = set()
+                for child in run_group.children:
+                    cols.update(list(child.all_data.columns))
 
             title = self.extra_title_expr(run_group.children) + \
                 run_group.accumulated_metadata.minus(self.root_metadata).pretty_print()
@@ -227,10 +390,18 @@ class MultiAxesRenderer(Renderer):
         # ticks don't just depend on what happens to be plotted on first_ax.
         # The actual limit is set with axes.set_xlim() which has to be numeric
         # despite the fact that we're plotting a TimedeltaIndex.
-        timeline = pd.TimedeltaIndex([])
-        for run in run_group.iterruns():
-            timeline = timeline.union(run.all_data.index)
-        first_ax.set_xlim(xmin=0, xmax=timeline.max().total_seconds())
+        runs = list(run_group.iterruns())
+        store = shared_store(runs)
+        if store is not None:
+            _, xmax = store.extent(runs)
+        else:
+            timeline = pd.TimedeltaIndex([])
+            for run in runs:
+                timeline = timeline.union(run.all_data.index)
+            xmax = timeline.max()
+        # Without any data there is no timeline to fit
+        if pd.notna(xmax):
+            first_ax.set_xlim(xmin=0, xmax=xmax.total_seconds())
 
         for i, subject in enumerate(axes_subjects[1:], 2):
             axes[subject] = figure.add_subplot(len(axes_subjects), 1, i, sharex=first_ax)
@@ -240,19 +411,160 @@ class MultiAxesRenderer(Renderer):
             for child in run_group.children:
                 renderer(renderer, child, axes[subject], subject)
 
-        axes[axes_subjects[0]].set_title("\n".join(wrap(title)))
-        self.axes_expr(axes)
+        with self.report.phase('decorate'):
+            axes[axes_subjects[0]].set_title("\n".join(wrap(title)))
+            self.axes_expr(axes)
+        self.report.count('figures')
+        return figure
 
 
+# Pass the RunGroups returned by BenchArt.add() as groups to render only those
+# without running the BenchArt again. Give a Report (see timing.py) as profile
+# to record the time spent in each renderer. replicates, raw and downsample
+# are as for render().
 def render_multi(benchart, figwidth, sorted_prefixes, timebounds, relabels,
-                  extra_title_expr, axes_expr):
-    root = benchart.run()
+                  extra_title_expr, axes_expr, groups=None, profile=None,
+                  replicates=False, raw=False, downsample=None):
+    report = as_report(profile)
+    if groups is None:
+        with report.phase('run'):
+            root = benchart.run()
+    else:
+        root = benchart.tree.children[0]
     title = ''
     renderers = [
-        LeafParentRenderer(root.metadata, relabels=relabels, extra_title_expr=extra_title_expr),
+        LeafParentRenderer(root.metadata, relabels=relabels,
+                           extra_title_expr=extra_title_expr, only=groups),
         MultiAxesRenderer(figwidth=figwidth, axes_expr=axes_expr),
         PlotRenderer(occludes=benchart.ignores, relabels=relabels,
-                           timebounds=timebounds),
+                           timebounds=timebounds, replicates=replicates,
+                           raw=raw, downsample=downsample),
     ]
-    renderers[0](renderers[1:], root, sorted_prefixes=sorted_prefixes, title='')
+    for renderer in renderers:
+        renderer.report = report
+    with report.phase('render'):
+        renderers[0](renderers[1:], root, sorted_prefixes=sorted_prefixes,
+                     title='')
     return root, title
+
+
+def export_multi(benchart, outdir, figwidth, sorted_prefixes, timebounds,
+                 relabels, extra_title_expr, axes_expr, formats=('png',),
+                 workers=None, groups=None, profile=None, replicates=False,
+                 raw=False, downsample=None):
+    """
+    Like render_multi() but each leaf parent RunGroup's figure is saved to
+    files in outdir, one per format, instead of being shown. Figures are drawn
+    in a pool of worker processes using the Agg backend (in this process when
+    workers is 1) and closed as soon as they are saved. Worker processes can
+    only be sent an axes_expr which pickles, i.e. a function defined at the
+    top level of a module rather than a lambda or a nested function; with any
+    other, figures are drawn in this process instead. An index.html listing
+    every figure is written to outdir. Returns the paths of the saved files.
+    Give a Report (see timing.py) as profile to record the time spent. Only
+    the total is recorded for figures drawn in worker processes.
+    """
+    report = as_report(profile)
+    if groups is None:
+        with report.phase('run'):
+            root = benchart.run()
+    else:
+        root = benchart.tree.children[0]
+
+    # Collect the leaf parent RunGroups with the columns and title
+    # LeafParentRenderer would pass to a MultiAxesRenderer
+    jobs = []
+    def collect(renderers, run_group, cols, title=''):
+        jobs.append((run_group, cols, title))
+    LeafParentRenderer(root.metadata, relabels=relabels,
+                       extra_title_expr=extra_title_expr, only=groups)(
+        [collect], root, sorted_prefixes=sorted_prefixes)
+
+    os.makedirs(outdir, exist_ok=True)
+    renderers = [
+        MultiAxesRenderer(figwidth=figwidth, axes_expr=axes_expr),
+        PlotRenderer(occludes=benchart.ignores, relabels=relabels,
+                     timebounds=timebounds, replicates=replicates, raw=raw,
+                     downsample=downsample),
+    ]
+
+    if workers != 1 and not picklable(renderers):
+        workers = 1
+
+    def tasks():
+        for i, (run_group, cols, title) in enumerate(jobs):
+            yield i, (renderers, detach(run_group), cols, title,
+                      os.path.join(outdir, f'figure-{i:04d}'), formats)
+
+    saved = [None] * len(jobs)
+    with report.phase('export'):
+        if workers == 1:
+            for renderer in renderers:
+                renderer.report = report
+            for i, task in tasks():
+                saved[i] = export_figure(*task)
+        else:
+            workers = workers or os.cpu_count()
+            with ProcessPoolExecutor(max_workers=workers,
+                                     initializer=plt.switch_backend,
+                                     initargs=('Agg',)) as executor:
+                # Only submit a few figures per worker at a time so that the
+                # detached Runs waiting to be sent don't pile up in memory
+                pending = {}
+                for i, task in tasks():
+                    if len(pending) >= 2 * workers:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            saved[pending.pop(future)] = future.result()
+                    pending[executor.submit(export_figure, *task)] = i
+                for future in pending:
+                    saved[pending[future]] = future.result()
+
+    write_index(outdir, [title for _, _, title in jobs], saved)
+    return [path for paths in saved for path in paths]
+
+# Whether obj can be sent to a worker process
+def picklable(obj):
+    try:
+        pickle.dumps(obj)
+    except (pickle.PicklingError, AttributeError, TypeError):
+        return False
+    return True
+
+# Copy a RunGroup and its Runs without the rest of the tree so that it can be
+# sent to another process. The copy has no parent, so its metadata is the
+# accumulated metadata of the original and Run labels are unchanged.
+def detach(run_group):
+    runs = []
+    for run in run_group.iterruns():
+        runs.append(Run(run.id, run.all_data, RunMetadata(dict(run.metadata)),
+                        run.stats, run.filename))
+        runs[-1].pyramid = run.pyramid
+        runs[-1].lines = run.lines
+    return RunGroup(None, RunMetadata(dict(run_group.accumulated_metadata)), runs)
+
+def export_figure(renderers, run_group, cols, title, path, formats):
+    renderer, *renderers = renderers
+    figure = renderer(renderers, run_group, cols, title=title)
+    paths = []
+    with renderer.report.phase('savefig'):
+        for fmt in formats:
+            paths.append(f'{path}.{fmt}')
+            figure.savefig(paths[-1], format=fmt)
+        plt.close(figure)
+    return paths
+
+def write_index(outdir, titles, saved):
+    with open(os.path.join(outdir, 'index.html'), 'w') as f:
+        f.write('<!DOCTYPE html>\n<html><head><meta charset="utf-8">'
+                '<title>bencharts</title></head><body>\n')
+        for title, paths in zip(titles, saved):
+            f.write(f'<section><pre>{html.escape(title)}</pre>\n')
+            for path in paths:
+                name = html.escape(os.path.basename(path))
+                if path.endswith(('.png', '.svg', '.jpg')):
+                    f.write(f'<img src="{name}" style="max-width: 100%">\n')
+                else:
+                    f.write(f'<a href="{name}">{name}</a>\n')
+            f.write('</section>\n')
+        f.write('</body></html>\n')
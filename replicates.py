@@ -0,0 +1,145 @@
+import numpy as np
+import pandas as pd
+from grid import align
+from stats import to_timedelta
+
+# Replicates are Runs of the same configuration: sibling Runs whose label
+# metadata (see Run.label_metadata()) is identical once occluded attributes
+# are left out, so they would be plotted with the same label. Their data is
+# aligned on one grid (see grid.py) and reduced to a mean, min/max and a
+# confidence band per time bin, for all bins and metrics at once.
+
+# Two-sided critical values of Student's t distribution for 1 to 30 degrees
+# of freedom, followed by the normal quantile they tend to
+T_TABLE = {
+    0.90: ([6.314, 2.920, 2.353, 2.132, 2.015, 1.943, 1.895, 1.860, 1.833,
+            1.812, 1.796, 1.782, 1.771, 1.761, 1.753, 1.746, 1.740, 1.734,
+            1.729, 1.725, 1.721, 1.717, 1.714, 1.711, 1.708, 1.706, 1.703,
+            1.701, 1.699, 1.697], 1.645),
+    0.95: ([12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262,
+            2.228, 2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101,
+            2.093, 2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052,
+            2.048, 2.045, 2.042], 1.960),
+    0.99: ([63.657, 9.925, 5.841, 4.604, 4.032, 3.707, 3.499, 3.355, 3.250,
+            3.169, 3.106, 3.055, 3.012, 2.977, 2.947, 2.921, 2.898, 2.878,
+            2.861, 2.845, 2.831, 2.819, 2.807, 2.797, 2.787, 2.779, 2.771,
+            2.763, 2.756, 2.750], 2.576),
+}
+
+BANDS = {'ci', 'minmax'}
+
+
+# The critical value of t for each of dof (an array). Beyond the table it is
+# interpolated in 1/dof towards the normal quantile.
+def t_critical(confidence, dof):
+    if confidence not in T_TABLE:
+        raise ValueError(f'confidence must be one of {sorted(T_TABLE)}')
+    table, z = T_TABLE[confidence]
+    table = np.asarray(table)
+    dof = np.asarray(dof)
+    small = table[np.clip(dof, 1, len(table)) - 1]
+    large = z + (table[-1] - z) * len(table) / np.maximum(dof, 1)
+    return np.where(dof <= len(table), small, large)
+
+
+class Aggregate:
+    """
+    The replicates runs (their ids) reduced to statistics per time bin and
+    metric: each of count, mean, std, min, max, lower and upper is a times x
+    metrics array. lower and upper bound the confidence interval of the mean,
+    which is NaN where fewer than two replicates have a value.
+    """
+    FIELDS = ('count', 'mean', 'std', 'min', 'max', 'lower', 'upper')
+
+    def __init__(self, runs, times, metrics, **fields):
+        self.runs = runs
+        self.times = times
+        self.metrics = metrics
+        for name in self.FIELDS:
+            setattr(self, name, fields[name])
+
+    def __repr__(self):
+        return (f'Aggregate({len(self.runs)} runs x {len(self.times)} times x '
+                f'{len(self.metrics)} metrics)')
+
+    # The statistics of one metric as a DataFrame indexed by time
+    def frame(self, metric):
+        j = self.metrics.index(metric)
+        return pd.DataFrame({name: getattr(self, name)[:, j]
+                             for name in self.FIELDS}, index=self.times)
+
+
+def replicate_sets(runs, occludes=frozenset()):
+    """
+    Split runs into lists of replicates, in order of their first Run.
+    """
+    sets = {}
+    for run in runs:
+        if run.rungroup is not None:
+            key = run.label_metadata(occludes)
+        else:
+            key = run.metadata.subset(run.metadata.keys() - occludes)
+        sets.setdefault(key, []).append(run)
+    return list(sets.values())
+
+
+def aggregate(runs, interval, confidence=0.95, how='mean', columns=None):
+    """
+    align() runs onto bins of interval, with samples in each bin aggregated
+    with how and gaps filled linearly, and reduce them to an Aggregate.
+    """
+    aligned = align(runs, interval, how, columns, fill='linear')
+    values = aligned.values
+
+    # np.nan* functions warn about bins without any values, so they are
+    # counted and masked instead
+    present = ~np.isnan(values)
+    count = present.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(count > 0, np.nansum(values, axis=0) / count, np.nan)
+        squares = np.nansum((values - mean) ** 2, axis=0)
+        std = np.where(count > 1, np.sqrt(squares / (count - 1)), np.nan)
+        half = t_critical(confidence, np.maximum(count - 1, 1)) * std / np.sqrt(count)
+
+    return Aggregate(aligned.runs, aligned.times, aligned.metrics, count=count,
+                     mean=mean, std=std,
+                     min=np.fmin.reduce(values, axis=0),
+                     max=np.fmax.reduce(values, axis=0),
+                     lower=mean - half, upper=mean + half)
+
+
+# A typical sampling interval of runs: the median time between samples of the
+# first Run with more than one
+def sampling_interval(runs):
+    for run in runs:
+        index = run.all_data.index
+        if len(index) > 1:
+            return pd.Timedelta(np.median(np.diff(index.as_unit('ns').asi8)), 'ns')
+    return pd.Timedelta(seconds=1)
+
+
+def aggregate_group(run_group, occludes=frozenset(), interval=None,
+                    confidence=0.95, how='mean'):
+    """
+    Find the replicates among the Runs of run_group and aggregate() each set
+    of more than one. Returns a dict of the id of each Run to its replicates
+    and their Aggregate (None for a Run without replicates). interval defaults
+    to the sampling interval of the Runs. The result is cached on the RunGroup
+    until its Runs or metadata change.
+    """
+    runs = list(run_group.iterruns())
+    key = ('replicates', tuple(run.id for run in runs), frozenset(occludes),
+           to_timedelta(interval), confidence, how)
+    if key not in run_group.aligned:
+        result = {}
+        for replicates in replicate_sets(runs, occludes):
+            if len(replicates) > 1:
+                step = interval if interval is not None else \
+                    sampling_interval(replicates)
+                reduced = aggregate(replicates, step, confidence, how)
+            else:
+                reduced = None
+            for run in replicates:
+                result[run.id] = (replicates, reduced)
+        run_group.aligned[key] = result
+    return run_group.aligned[key]
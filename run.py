@@ -1,5 +1,4 @@
-import matplotlib.pyplot as plt
-from renderer import render_print_tree
+from tree import render_print_tree
 from benchart import BenchArt
 from loader import Loader
 from discards import *
@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+from benchart import IgnoreStep
+from metadata import MISSING
+from pyramid import REDUCIBLE
+from store import shared_store
+
+# Summary statistics of many Runs computed at once on a single stacked frame
+# of all of their data rather than by slicing each Run's DataFrame in turn.
+
+AGGREGATIONS = {'mean', 'std', 'min', 'max', 'median', 'sum', 'count', 'first',
+                'last'}
+
+
+def stack(runs, columns=None):
+    """
+    Concatenate the all_data of runs into one DataFrame indexed by run id and
+    relative_time, keeping only columns if given.
+    """
+    store = shared_store(runs)
+    if store is not None:
+        return store.select(runs, columns)
+
+    frames = {}
+    for run in runs:
+        df = run.all_data
+        if columns is not None:
+            df = df.reindex(columns=columns)
+        frames[run.id] = df
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, names=['run', 'relative_time'])
+
+
+def to_timedelta(bound):
+    if bound is None or isinstance(bound, pd.Timedelta):
+        return bound
+    if isinstance(bound, str):
+        return pd.Timedelta(bound)
+    return pd.Timedelta(seconds=bound)
+
+
+def summarize(benchart, metrics, window=(None, None), runs=None, pyramids=False):
+    """
+    Compute metrics for every Run of benchart (or just runs) in one pass.
+    metrics maps the name of each output column to a (column, how) pair. how is
+    one of AGGREGATIONS, a quantile between 0 and 1 (e.g. 0.99 for p99) or
+    'rate', the change in the column per second over the window, for counters.
+    window is a (start, end) pair of times relative to the start of each Run,
+    as seconds, Timedeltas or strings like '1min', so that e.g. warmup can be
+    excluded. Either end may be None.
+    With pyramids, when every Run has a pyramid (see Loader.run()) and every
+    how is one of pyramid.REDUCIBLE, the metrics are computed from a few
+    buckets of each pyramid instead of the data, to within a bucket at either
+    end of the window (see Pyramid.reduce()).
+    Returns a table with one row per Run indexed by the attributes used to
+    partition the benchart, in partition order, and the Run id.
+    """
+    runs = list(benchart.runs if runs is None else runs)
+    start, end = (to_timedelta(bound) for bound in window)
+    if pyramids and all(run.pyramid is not None for run in runs) and \
+            all(how in REDUCIBLE for _, how in metrics.values()):
+        result = pd.DataFrame({
+            name: [run.pyramid.reduce(column, how, start, end)
+                   if column in run.pyramid.positions else np.nan for run in runs]
+            for name, (column, how) in metrics.items()
+        }, index=pd.Index([run.id for run in runs], name='run'))
+    else:
+        result = aggregate_runs(runs, metrics, start, end)
+
+    # Attributes no Run has don't partition the benchart either (see
+    # Step.partition()), so they are left out of the index
+    attrs = [attr for step in benchart.user_steps
+             if not isinstance(step, IgnoreStep) for attr in sorted(step.attrs)
+             if any(attr in run.metadata for run in runs)]
+    for attr in reversed(attrs):
+        result.insert(0, attr, [run.metadata.get(attr, MISSING) for run in runs])
+    return result.reset_index().set_index(attrs + ['run'])
+
+
+# The metrics of runs from their stacked data
+def aggregate_runs(runs, metrics, start, end):
+    columns = sorted({column for column, _ in metrics.values()})
+    data = stack(runs, columns)
+
+    times = data.index.get_level_values('relative_time')
+    mask = pd.Series(True, index=data.index)
+    if start is not None:
+        mask &= times >= start
+    if end is not None:
+        mask &= times <= end
+    data = data[mask.to_numpy()]
+    grouped = data.groupby(level='run', sort=False)
+
+    result = pd.DataFrame(index=pd.Index([run.id for run in runs], name='run'))
+    for name, (column, how) in metrics.items():
+        if how == 'rate':
+            values = data[column].dropna()
+            by_run = values.groupby(level='run', sort=False)
+            elapsed = values.index.get_level_values('relative_time') \
+                .to_series(index=values.index).groupby(level='run', sort=False)
+            seconds = (elapsed.last() - elapsed.first()) / pd.Timedelta(seconds=1)
+            result[name] = (by_run.last() - by_run.first()) / seconds.where(seconds > 0)
+        elif isinstance(how, float):
+            result[name] = grouped[column].quantile(how)
+        elif how in AGGREGATIONS:
+            result[name] = grouped[column].agg(how)
+        else:
+            raise ValueError(f'Unknown aggregation {how!r} for metric {name!r}')
+    return result
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+
+class RunStore:
+    """
+    The data of many Runs kept in a single DataFrame indexed by run id and
+    relative_time and sorted by both. Each Run's all_data becomes a slice of
+    the stored frame holding only the columns that Run had, so queries across
+    Runs, like the extent of their timelines or the union of their columns,
+    are done on one frame instead of one DataFrame per Run.
+    Columns which only some Runs have are stored with missing values for the
+    others, so integer columns may become floats.
+    """
+    def __init__(self, runs):
+        # Runs without data keep their own empty DataFrame
+        runs = sorted((run for run in runs if len(run.all_data)),
+                      key=lambda run: run.id)
+        if runs:
+            self.frame = pd.concat({run.id: run.all_data for run in runs},
+                                   names=['run', 'relative_time'])
+        else:
+            index = pd.MultiIndex.from_arrays([[], pd.TimedeltaIndex([])],
+                                              names=['run', 'relative_time'])
+            self.frame = pd.DataFrame(index=index)
+        if not self.frame.index.is_monotonic_increasing:
+            self.frame = self.frame.sort_index()
+
+        ids = self.frame.index.get_level_values('run')
+        self.ids = np.array([run.id for run in runs])
+        self.starts = np.searchsorted(ids, self.ids, side='left')
+        self.stops = np.searchsorted(ids, self.ids, side='right')
+        self.positions = {id: i for i, id in enumerate(self.ids)}
+        self.times = self.frame.index.get_level_values('relative_time')
+
+        self.columns = {}
+        for run in runs:
+            self.columns[run.id] = list(run.all_data.columns)
+            run.all_data = None
+            run.data_source = self
+
+    def get(self, run):
+        i = self.positions[run.id]
+        df = self.frame.iloc[self.starts[i]:self.stops[i]]
+        if len(self.columns[run.id]) != len(self.frame.columns):
+            df = df[self.columns[run.id]]
+        return df.droplevel('run')
+
+    # The earliest and latest relative_time of any of runs, or None and None
+    # if none of them has data
+    def extent(self, runs):
+        i = np.array([self.positions[run.id] for run in runs], dtype=np.intp)
+        i = i[self.stops[i] > self.starts[i]]
+        if not len(i):
+            return None, None
+        return self.times[self.starts[i]].min(), self.times[self.stops[i] - 1].max()
+
+    # The union of the columns of runs in the order of the stored frame
+    def columns_of(self, runs):
+        wanted = set()
+        for run in runs:
+            wanted.update(self.columns[run.id])
+        return [column for column in self.frame.columns if column in wanted]
+
+    # The stored rows of runs, with only columns if given
+    def select(self, runs, columns=None):
+        i = np.array([self.positions[run.id] for run in runs], dtype=np.intp)
+        rows = np.concatenate([np.arange(start, stop) for start, stop in
+                               zip(self.starts[i], self.stops[i])] or [[]]).astype(np.intp)
+        df = self.frame.iloc[rows]
+        if columns is not None:
+            df = df.reindex(columns=columns)
+        return df
+
+
+# The RunStore holding the data of every one of runs, if there is one
+def shared_store(runs):
+    stores = {id(run.data_source): run.data_source for run in runs}
+    if len(stores) != 1:
+        return None
+    store = next(iter(stores.values()))
+    return store if isinstance(store, RunStore) else None
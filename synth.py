@@ -0,0 +1,163 @@
+#!/usr/bin/python3
+
+import argparse
+import datetime
+import json
+import os
+import random
+
+# Writes a results directory of synthetic pgbench-style result files for
+# benchmarking (see bench.py) and trying things out without real results.
+# Each file has a "metadata" object shaped like ours (benchmark config,
+# machine, disk and block device settings, GUCs) followed by "data" with a
+# pgbench progress timeline and any number of other sources sampled half a
+# second apart from it. The expressions to load them are below:
+#
+#   Loader(outdir).run(synth.data_exprs(sources), synth.metadata,
+#                      synth.stats, synth.TIMELINE)
+
+TIMELINE = 'ts'
+
+# Data sources after pgbench, and the columns of each. Sources beyond these
+# are named source3, source4, ...
+SOURCES = {
+    'pgbench': ['tps', 'lat'],
+    'iostat': ['rkbs', 'wkbs', 'util'],
+    'vmstat': ['free', 'cs'],
+}
+
+START = datetime.datetime(2022, 7, 1, tzinfo=datetime.timezone.utc)
+
+
+def source_names(sources):
+    names = list(SOURCES)[:sources]
+    return names + [f'source{i}' for i in range(len(names), sources)]
+
+
+# The flattened name of the ith synthetic attribute
+def attr_name(i, depth=1):
+    return '_'.join(['params'] + [f'level{k}' for k in range(depth - 1)] +
+                    [f'attr{i}'])
+
+
+def make_metadata(rng, attrs, cardinality, depth, gucs):
+    metadata = {
+        'benchmark': {
+            'large_read': rng.choice(['', 'none', 'seq']),
+            'config': {'scale': rng.choice([100, 1000]), 'time': 600},
+        },
+        'machine': {
+            'instance': {
+                'type': rng.choice(['Standard_D2ds_v4', 'Standard_D16ds_v4']),
+                'hostinfo': {'Hostname': f'vm-{rng.randrange(4)}',
+                             'KernelRelease': rng.choice(['5.18.5', '5.18.5+'])},
+            },
+            'disk': {
+                'caching': rng.choice(['None', 'ReadOnly']),
+                'limits': {'size': rng.choice(['p30', 'p40', 'ultra1024'])},
+                'block_device_settings': {
+                    'queue_depth': rng.choice([128, 316]),
+                    'nr_hw_queues': rng.choice([1, 2]),
+                    'nr_requests': rng.choice([256, 316]),
+                    'scheduler': rng.choice(['none', 'mq-deadline']),
+                },
+            },
+        },
+        'postgres': {
+            'version': '16devel',
+            'gucs': {f'guc_{i}': str(rng.randrange(cardinality))
+                     for i in range(gucs)},
+        },
+    }
+
+    params = metadata['params'] = {}
+    for i in range(attrs):
+        node = params
+        for k in range(depth - 1):
+            node = node.setdefault(f'level{k}', {})
+        node[f'attr{i}'] = f'value{rng.randrange(cardinality)}'
+    return metadata
+
+
+def make_data(rng, samples, sources):
+    data = {}
+    for n, name in enumerate(source_names(sources)):
+        columns = SOURCES.get(name, ['value'])
+        offset = 0 if n == 0 else 0.5
+        rows = []
+        for s in range(samples):
+            row = {TIMELINE: (START + datetime.timedelta(seconds=s + offset)).isoformat()}
+            for column in columns:
+                row[column] = rng.random() * 1000
+            rows.append(row)
+        data[name] = rows
+    return {'pgbench': {'progress': data.pop('pgbench')}, **data}
+
+
+def generate(outdir, runs=100, attrs=10, cardinality=3, depth=2, samples=600,
+             sources=2, gucs=0, seed=0):
+    """
+    Write runs result files to outdir. Each has attrs extra metadata
+    attributes nested depth maps deep (see attr_name()), each taking one of
+    cardinality values, gucs GUCs under postgres_gucs and samples rows of data
+    from each of sources data sources.
+    """
+    rng = random.Random(seed)
+    os.makedirs(outdir, exist_ok=True)
+    for i in range(runs):
+        result = {
+            'metadata': make_metadata(rng, attrs, cardinality, depth, gucs),
+            'data': make_data(rng, samples, sources),
+        }
+        with open(os.path.join(outdir, f'run-{i:06d}.json'), 'w') as f:
+            json.dump(result, f)
+
+
+class Source:
+    """
+    The data expression of a synthetic data source
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __call__(self, all_info):
+        if self.name == 'pgbench':
+            return all_info['data']['pgbench']['progress']
+        return all_info['data'][self.name]
+
+    def __repr__(self):
+        return f'Source({self.name!r})'
+
+
+def data_exprs(sources=2):
+    return {name: Source(name) for name in source_names(sources)}
+
+
+def metadata(all_info):
+    return all_info['metadata']
+
+
+def stats(all_info):
+    return {'samples': len(all_info['data']['pgbench']['progress'])}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Write synthetic pgbench-style result files')
+    parser.add_argument('outdir')
+    parser.add_argument('--runs', type=int, default=100)
+    parser.add_argument('--attrs', type=int, default=10,
+                        help='number of extra metadata attributes')
+    parser.add_argument('--cardinality', type=int, default=3,
+                        help='number of distinct values of each attribute')
+    parser.add_argument('--depth', type=int, default=2,
+                        help='nesting depth of the extra attributes')
+    parser.add_argument('--samples', type=int, default=600,
+                        help='rows of data per source')
+    parser.add_argument('--sources', type=int, default=2,
+                        help='number of data sources')
+    parser.add_argument('--gucs', type=int, default=0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate(args.outdir, args.runs, args.attrs, args.cardinality, args.depth,
+             args.samples, args.sources, args.gucs, args.seed)
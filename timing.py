@@ -0,0 +1,173 @@
+from contextlib import contextmanager, nullcontext
+import cProfile
+import json
+import pstats
+import time
+import tracemalloc
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Instrumentation of the load -> group -> render pipeline. Loader, BenchArt
+# and the render functions take a profile argument: True (or a Report to
+# share one between them) to record where their time goes into a Report.
+# Without it they record into NULL, which does nothing.
+
+
+class Report:
+    """
+    Wall clock time and number of calls of each phase of the pipeline, the
+    time of each phase per file loaded, counters (files parsed, rows, ...) and
+    peak memory. With cprofile, the phases are also profiled with cProfile
+    (see profile_stats()). With tracemalloc, the peak memory allocated by
+    Python during each outermost phase is recorded too. Neither covers work
+    done in worker processes.
+    """
+    enabled = True
+
+    def __init__(self, cprofile=False, tracemalloc=False):
+        # name: [seconds, calls]
+        self.phases = {}
+        # file: {name: seconds}
+        self.files = {}
+        self.counters = {}
+        # name: peak bytes traced by tracemalloc
+        self.peaks = {}
+        self.profiler = cProfile.Profile() if cprofile else None
+        self.tracemalloc = tracemalloc
+        self.depth = 0
+
+    @contextmanager
+    def phase(self, name):
+        outermost = self.depth == 0
+        if outermost:
+            if self.tracemalloc:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                tracemalloc.reset_peak()
+            if self.profiler is not None:
+                self.profiler.enable()
+        self.depth += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.depth -= 1
+            totals = self.phases.setdefault(name, [0.0, 0])
+            totals[0] += elapsed
+            totals[1] += 1
+            if outermost:
+                if self.profiler is not None:
+                    self.profiler.disable()
+                if self.tracemalloc:
+                    peak = tracemalloc.get_traced_memory()[1]
+                    self.peaks[name] = max(self.peaks.get(name, 0), peak)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    # Add the phases and counters of other, usually the Report of a single
+    # file made in a worker process, to this one
+    def merge(self, other, file=None):
+        for name, (seconds, calls) in other.phases.items():
+            totals = self.phases.setdefault(name, [0.0, 0])
+            totals[0] += seconds
+            totals[1] += calls
+        for name, n in other.counters.items():
+            self.count(name, n)
+        if file is not None:
+            self.files[file] = {name: seconds for name, (seconds, _)
+                                in other.phases.items()}
+
+    # The maximum resident set size of this process and of its finished
+    # children (e.g. worker processes) in bytes, if known
+    def peak_rss(self):
+        if resource is None:
+            return None
+        usage = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                    resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+        return usage * 1024
+
+    def profile_stats(self, sort='cumulative'):
+        if self.profiler is None:
+            return None
+        return pstats.Stats(self.profiler).sort_stats(sort)
+
+    # One row per phase with its total and mean seconds and number of calls
+    def frame(self):
+        df = pd.DataFrame([(name, seconds, calls) for name, (seconds, calls)
+                           in self.phases.items()],
+                          columns=['phase', 'seconds', 'calls']).set_index('phase')
+        df['mean'] = df['seconds'] / df['calls']
+        if self.peaks:
+            df['peak_traced_bytes'] = pd.Series(self.peaks)
+        return df
+
+    # Per file seconds of each phase, one row per file
+    def file_frame(self):
+        return pd.DataFrame.from_dict(self.files, orient='index')
+
+    def to_dict(self):
+        return {
+            'phases': {name: {'seconds': seconds, 'calls': calls}
+                       for name, (seconds, calls) in self.phases.items()},
+            'files': self.files,
+            'counters': self.counters,
+            'peak_traced_bytes': self.peaks,
+            'peak_rss_bytes': self.peak_rss(),
+        }
+
+    # Return the report as JSON, also writing it to path if given
+    def to_json(self, path=None):
+        output = json.dumps(self.to_dict(), indent=2)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(output)
+        return output
+
+    def __str__(self):
+        lines = [f'{name:30} {seconds:10.3f}s {calls:8d} calls'
+                 for name, (seconds, calls) in self.phases.items()]
+        lines += [f'{name:30} {n:10d}' for name, n in self.counters.items()]
+        peak = self.peak_rss()
+        if peak is not None:
+            lines.append(f'{"peak rss":30} {peak / 2**20:10.1f} MiB')
+        return '\n'.join(lines)
+
+    # A Report is pickled with the Loader to worker processes, where a
+    # cProfile profiler can't go
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['profiler'] = None
+        return state
+
+
+class NullReport:
+    """
+    Records nothing. Used when profiling is off so that callers don't need to
+    check.
+    """
+    enabled = False
+
+    def phase(self, name):
+        return nullcontext()
+
+    def count(self, name, n=1):
+        pass
+
+    def merge(self, other, file=None):
+        pass
+
+
+NULL = NullReport()
+
+
+# The Report for a profile argument: a new one for True, the one given or NULL
+def as_report(profile):
+    if isinstance(profile, (Report, NullReport)):
+        return profile
+    return Report() if profile else NULL
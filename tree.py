@@ -0,0 +1,104 @@
+import json
+from benchart import Run
+from timing import as_report
+
+# Output of a BenchArt tree as text, JSON or a summary table. Nothing here
+# needs matplotlib or the data of Runs, so it can be used headless (see
+# cli.py). The write_*() functions write to out as the tree is walked rather
+# than building the output in memory, and leave the tree unchanged.
+
+
+def do_relabel_tree(metadata, relabels):
+    result = {}
+    for k, v in metadata.items():
+        key = k
+        if k in relabels.keys():
+            key = relabels[k]
+        result[key] = v
+    return result
+
+def render_print_tree(root, occludes=None, relabels=None, indent=0,
+                      profile=None):
+    if profile is not None:
+        with as_report(profile).phase('render_print_tree'):
+            return render_print_tree(root, occludes, relabels, indent)
+
+    if isinstance(root, Run):
+        display = f"{str(root)}: "
+        show_attrs = root.metadata.keys() - root.rungroup.accumulated_attrs
+        if show_attrs:
+            if occludes:
+                show_attrs -= occludes
+            subset = root.metadata.subset(show_attrs)
+            attributes = str(subset)
+            if relabels:
+                attributes = str(do_relabel_tree(subset, relabels))
+            display += attributes
+        print(" " * indent + display)
+        return
+
+    if relabels:
+        root.metadata = do_relabel_tree(root.metadata, relabels)
+
+    print(" " * indent + str(root))
+
+    for node in root.children:
+        render_print_tree(node, occludes, relabels, indent + 2)
+
+
+# The same lines as render_print_tree()
+def write_text(root, out, occludes=frozenset(), relabels=None, indent=0):
+    relabels = relabels or {}
+    if isinstance(root, Run):
+        display = f'{root}: '
+        if root.metadata.keys() - root.rungroup.accumulated_attrs:
+            subset = root.label_metadata(frozenset(occludes or ()))
+            display += str(do_relabel_tree(subset, relabels))
+        out.write(' ' * indent + display + '\n')
+        return
+
+    out.write(' ' * indent + f'Metadata: {do_relabel_tree(root.metadata, relabels)}\n')
+    for node in root.children:
+        write_text(node, out, occludes, relabels, indent + 2)
+
+
+# The tree as one JSON object: each RunGroup is {"metadata": ...,
+# "children": [...]} and each Run {"run": id, "filename": ...,
+# "metadata": ...} with only the metadata which isn't in its RunGroups
+def write_json(root, out, occludes=frozenset(), relabels=None):
+    relabels = relabels or {}
+    occludes = frozenset(occludes or ())
+
+    def write(node):
+        if isinstance(node, Run):
+            out.write(json.dumps({
+                'run': node.id,
+                'filename': node.filename,
+                'metadata': do_relabel_tree(node.label_metadata(occludes), relabels),
+            }, default=str))
+            return
+        out.write('{"metadata": ')
+        out.write(json.dumps(do_relabel_tree(node.metadata, relabels), default=str))
+        out.write(', "children": [')
+        for i, child in enumerate(node.children):
+            if i:
+                out.write(', ')
+            write(child)
+        out.write(']}')
+
+    write(root)
+    out.write('\n')
+
+
+# A tab separated table with one row per RunGroup whose children are Runs:
+# the values of attrs for it, how many Runs it has and their ids
+def write_summary(root, out, attrs, relabels=None):
+    relabels = relabels or {}
+    out.write('\t'.join([relabels.get(attr, attr) for attr in attrs] +
+                        ['runs', 'ids']) + '\n')
+    for group in root.iterleafparents():
+        metadata = group.accumulated_metadata
+        runs = [child for child in group.children if isinstance(child, Run)]
+        row = [str(metadata.get(attr, '')) for attr in attrs]
+        row += [str(len(runs)), ','.join(str(run.id) for run in runs)]
+        out.write('\t'.join(row) + '\n')